@@ -12,8 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import pbr.version
 
-
-__version__ = pbr.version.VersionInfo(
-    'devstack-tools').version_string()
+def __getattr__(name):
+    # pbr is only imported when the version is asked for, as finding it
+    # costs more than everything else dsconf does at startup.
+    if name == '__version__':
+        import pbr.version
+        return pbr.version.VersionInfo('devstack-tools').version_string()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -13,96 +13,470 @@
 # under the License.
 
 import argparse
+import functools
+import glob
+import os.path
 import sys
 
 import devstack.dsconf
 
 
+INI_COMMANDS = ('iniset', 'inirm', 'inicomment', 'iniuncomment')
+LOCALCONF_COMMANDS = ('extract-localrc', 'extract', 'setlc', 'setlc_raw',
+                      'setlc_conf', 'merge_lc')
+
+# exit status of an editing command that left every file as it was,
+# when --exit-code is given
+EXIT_UNCHANGED = 3
+
+
+class OperationError(Exception):
+    """An operation read from a stream could not be parsed."""
+
+
+class OperationParser(argparse.ArgumentParser):
+    """Argument parser that raises instead of printing or exiting.
+
+    Operations are read from streams that also carry the replies, so
+    nothing may be printed and a bad operation must not end the
+    process.
+    """
+
+    def error(self, message):
+        raise OperationError(message)
+
+    def print_help(self, file=None):
+        raise OperationError("help is not available for operations")
+
+    def exit(self, status=0, message=None):
+        raise OperationError(message or "unexpected exit")
+
+
 def iniset(inifile, args):
-    inifile.set(args.section, args.name, args.value)
+    return inifile.set(args.section, args.name, args.value)
 
 
 def inirm(inifile, args):
-    inifile.remove(args.section, args.name)
+    return inifile.remove(args.section, args.name)
 
 
 def inicomment(inifile, args):
-    inifile.comment(args.section, args.name)
+    return inifile.comment(args.section, args.name)
 
 
 def iniuncomment(inifile, args):
-    inifile.uncomment(args.section, args.name)
+    return inifile.uncomment(args.section, args.name)
+
+
+def _shell_name(name):
+    """Return name as a shell variable name, _ replacing what is not."""
+    name = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+    return "_" + name if name[:1].isdigit() else name
+
+
+def iniget(inifile, args):
+    try:
+        values = inifile.get_many(args.section, args.names)
+    except (OSError, ValueError) as e:
+        print("dsconf: %s" % e, file=sys.stderr)
+        return 1
+    if args.format == 'json':
+        import json
+        print(json.dumps(values, indent=2))
+    elif args.format == 'shell':
+        import shlex
+        for name, value in values.items():
+            if value is not None:
+                print("%s=%s" % (_shell_name(name), shlex.quote(value)))
+    else:
+        for value in values.values():
+            print("" if value is None else value)
+    return 0
+
+
+def ini_files(patterns):
+    """Return the files of patterns, expanding the glob patterns.
+
+    A file name without wildcards is taken as it is, so that iniset can
+    create the file, but a glob pattern must match something.
+    """
+    fnames = []
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            fnames.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError("no file matches %s" % pattern)
+        fnames.extend(matches)
+    return fnames
+
+
+def _report(results):
+    """Print what happened to each file of results.
+
+    Returns 1 if any of them failed, else whether any changed.
+    """
+    changed = failed = False
+    for fname, result in results.items():
+        if isinstance(result, Exception):
+            print("dsconf: %s: %s" % (fname, result), file=sys.stderr)
+            failed = True
+        else:
+            print("%s %s" % ("changed" if result else "unchanged", fname))
+            changed = changed or result
+    return 1 if failed else changed
+
+
+def ini_all(func, patterns, args):
+    """Run the ini command func on every file of patterns at once."""
+    try:
+        fnames = ini_files(patterns)
+    except ValueError as e:
+        print("dsconf: %s" % e, file=sys.stderr)
+        return 1
+    return _report(devstack.dsconf.edit_all(
+        fnames, lambda inifile: func(inifile, args), max_workers=args.jobs))
+
+
+def _stamp(args):
+    if args.stamp is None:
+        return None
+    return devstack.dsconf.StampFile(args.stamp)
 
 
 def extract_local(local_conf, args):
-    local_conf.extract_localrc(args.local_rc)
+    return local_conf.extract_localrc(args.local_rc, _stamp(args),
+                                      args.force)
 
 
 def extract_config(local_conf, args):
-    local_conf.extract(args.group, args.conf, args.local_rc)
+    return local_conf.extract(args.group, args.conf, args.local_rc,
+                              _stamp(args), args.force)
+
+
+def _symbols(args):
+    symbols = devstack.dsconf.SymbolTable()
+    if args.env:
+        symbols.read_env()
+    for fname in args.vars_files:
+        symbols.read_file(fname)
+    if args.localrc:
+        symbols.read_localrc(args.local_conf)
+    for var in args.vars:
+        name, sep, value = var.partition('=')
+        if not sep:
+            raise ValueError("--var %s is not NAME=VALUE" % var)
+        symbols.update({name: value})
+    return symbols
+
+
+def _resolve(func):
+    """Run func, printing why variables could not be resolved."""
+    try:
+        return func()
+    except KeyError as e:
+        print("dsconf: variable %s is not defined" % e, file=sys.stderr)
+    except (ValueError, OSError) as e:
+        print("dsconf: %s" % e, file=sys.stderr)
+    return None
+
+
+def targets(local_conf, args):
+    found = _resolve(lambda: local_conf.targets(args.group, _symbols(args)))
+    if found is None:
+        return 1
+    if args.format == 'json':
+        import json
+        print(json.dumps([{'group': group, 'conf': conf, 'path': path}
+                          for (group, conf), path in found.items()],
+                         indent=2))
+    else:
+        for (group, conf), path in found.items():
+            print('%s\t%s\t%s' % (group, conf, path))
+    return 0
+
+
+def extract_all(local_conf, args):
+    results = _resolve(lambda: local_conf.extract_all(
+        args.group, _symbols(args), args.jobs))
+    if results is None:
+        return 1
+    return _report(results)
 
 
 def setlc(local_conf, args):
-    local_conf.set_local("%s=%s" % (args.name, args.value))
+    return local_conf.set_local("%s=%s" % (args.name, args.value))
 
 
 def setlc_raw(local_conf, args):
-    local_conf.set_local(" ".join(args.items))
+    return local_conf.set_local(" ".join(args.items))
 
 
 def setlc_conf(local_conf, args):
-    local_conf.set(args.group, args.conf, args.section, args.name, args.value)
+    return local_conf.set(args.group, args.conf, args.section, args.name,
+                          args.value)
 
 
 def merge(local_conf, args):
-    for source in args.sources:
-        local_conf.merge_lc(source)
+    return local_conf.merge_lc(*args.sources, jobs=args.jobs)
+
+
+def parse_operation(line, parser, commands=INI_COMMANDS):
+    """Parse a single dsconf command line.
+
+    The line uses the same grammar as the command line, either shell
+    quoted or as a JSON list of arguments. Returns None for blank
+    lines and lines starting with #.
+    """
+    import json
+    import shlex
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    try:
+        if line.startswith('['):
+            tokens = json.loads(line)
+        else:
+            tokens = shlex.split(line)
+    except ValueError as e:
+        raise OperationError(str(e))
+    if (not isinstance(tokens, list) or
+            not all(isinstance(t, str) for t in tokens)):
+        raise OperationError("operation must be a list of strings")
+    if not tokens or tokens[0] not in commands:
+        raise OperationError("unsupported operation %r" % line)
+    args = parser.parse_args(tokens)
+    if args.plan:
+        raise OperationError("--plan is only supported on the command line")
+    return args
+
+
+def read_operations(stream, parser, commands=INI_COMMANDS):
+    """Parse one dsconf command per line of stream."""
+    for lineno, line in enumerate(stream, 1):
+        try:
+            op = parse_operation(line, parser, commands)
+        except OperationError as e:
+            raise OperationError("line %d: %s" % (lineno, e))
+        if op is not None:
+            yield op
+
+
+def ini_apply(unused, args):
+    parser = build_parser(OperationParser, INI_COMMANDS)
+    try:
+        with args.operations:
+            operations = list(read_operations(args.operations, parser))
+    except OperationError as e:
+        print("dsconf: %s" % e, file=sys.stderr)
+        return 1
 
+    by_file = {}
+    for op in operations:
+        try:
+            fnames = ini_files(op.inifile)
+        except ValueError as e:
+            print("dsconf: %s" % e, file=sys.stderr)
+            return 1
+        for fname in fnames:
+            key = os.path.realpath(fname)
+            by_file.setdefault(key, (fname, []))[1].append(op)
+    changed = False
+    for fname, file_ops in by_file.values():
+        with devstack.dsconf.IniFile(fname).batch() as batch:
+            for op in file_ops:
+                changed = op.func(batch, op) or changed
+    return changed
+
+
+def _load_edits(stream, fmt=None):
+    """Read the edits of dsconf apply from stream.
+
+    The format is YAML for files named .yaml or .yml, unless fmt says
+    otherwise, and JSON for all others.
+    """
+    if fmt is None:
+        fmt = 'yaml' if stream.name.endswith(('.yaml', '.yml')) else 'json'
+    if fmt == 'json':
+        import json
+        return json.load(stream)
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("reading YAML needs PyYAML to be installed")
+    try:
+        return yaml.safe_load(stream)
+    except yaml.YAMLError as e:
+        raise ValueError(str(e))
+
+
+def apply(unused, args):
+    try:
+        with args.edits:
+            files = _load_edits(args.edits, args.format)
+        results = devstack.dsconf.apply_edits(files, max_workers=args.jobs)
+    except ValueError as e:
+        print("dsconf: %s" % e, file=sys.stderr)
+        return 1
+    return _report(results)
 
-def parse_args(argv):
-    parser = argparse.ArgumentParser(prog='dsconf')
-    subparsers = parser.add_subparsers(title='commands',
-                                       help='sub-command help')
 
+def serve(unused, args):
+    import devstack.server
+    devstack.server.serve(args.socket, defer=args.defer)
+
+
+def client(unused, args):
+    import devstack.server
+    return devstack.server.client(args.socket, args.command,
+                                  exit_code=args.exit_code)
+
+
+def coproc(args):
+    import devstack.server
+    devstack.server.serve_stream(sys.stdin, sys.stdout,
+                                 defer=args.coproc_defer)
+
+
+def run_plan(f, args):
+    """Run a command with --plan, printing what it would change."""
+    with devstack.dsconf.planning() as plan:
+        result = args.func(f, args)
+    if args.plan == 'json':
+        import json
+        print(json.dumps(plan.edits(), indent=2))
+    else:
+        sys.stdout.write(plan.diff())
+    return result
+
+
+def _add_symbol_arguments(parser):
+    parser.add_argument(
+        '--env', action='store_true',
+        help='take variables from the environment')
+    parser.add_argument(
+        '--vars-file', action='append', default=[], dest='vars_files',
+        metavar='FILE',
+        help='take variables from the NAME=VALUE lines of FILE, may be '
+             'repeated')
+    parser.add_argument(
+        '--localrc', action='store_true',
+        help='take variables from the localrc section of local.conf')
+    parser.add_argument(
+        '--var', action='append', default=[], dest='vars',
+        metavar='NAME=VALUE',
+        help='value of a variable used in the meta section headers, '
+             'may be repeated; wins over all of the above')
+
+
+def _add_stamp_arguments(parser):
+    parser.add_argument(
+        '--stamp', metavar='FILE',
+        help='skip the extraction if the meta section and the target '
+             'did not change since it was recorded in FILE')
+    parser.add_argument(
+        '--force', action='store_true',
+        help='with --stamp, extract even if nothing changed')
+
+
+def _add_plan_argument(parser):
+    parser.add_argument(
+        '--plan', nargs='?', const='diff', choices=('diff', 'json'),
+        help='print the changes as a unified diff (default) or as JSON '
+             'instead of writing them')
+
+
+def _add_jobs_argument(parser):
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of files edited at the same time, when there are '
+             'several')
+
+
+def _add_iniset(subparsers):
     parser_iniset = subparsers.add_parser('iniset',
                                           help='set item in ini file')
     parser_iniset.set_defaults(func=iniset)
-    parser_iniset.add_argument('inifile', help='name of file')
+    parser_iniset.add_argument(
+        'inifile', nargs='+',
+        help='name of file, or a glob pattern of files, may be repeated')
     parser_iniset.add_argument('section', help='name of section')
     parser_iniset.add_argument('name', help='name')
     parser_iniset.add_argument('value', help='value')
+    _add_jobs_argument(parser_iniset)
+    _add_plan_argument(parser_iniset)
+
 
+def _add_inicomment(subparsers):
     parser_inicomment = subparsers.add_parser(
         'inicomment',
         help='comment item in ini file')
     parser_inicomment.set_defaults(func=inicomment)
-    parser_inicomment.add_argument('inifile', help='name of file')
+    parser_inicomment.add_argument(
+        'inifile', nargs='+',
+        help='name of file, or a glob pattern of files, may be repeated')
     parser_inicomment.add_argument('section', help='name of section')
     parser_inicomment.add_argument('name', help='name')
+    _add_jobs_argument(parser_inicomment)
+    _add_plan_argument(parser_inicomment)
+
 
+def _add_iniuncomment(subparsers):
     parser_iniuncomment = subparsers.add_parser(
         'iniuncomment',
         help='uncomment item in ini file')
     parser_iniuncomment.set_defaults(func=iniuncomment)
-    parser_iniuncomment.add_argument('inifile', help='name of file')
+    parser_iniuncomment.add_argument(
+        'inifile', nargs='+',
+        help='name of file, or a glob pattern of files, may be repeated')
     parser_iniuncomment.add_argument('section', help='name of section')
     parser_iniuncomment.add_argument('name', help='name')
+    _add_jobs_argument(parser_iniuncomment)
+    _add_plan_argument(parser_iniuncomment)
 
+
+def _add_inirm(subparsers):
     parser_inirm = subparsers.add_parser(
         'inirm',
         help='delete item from ini file')
     parser_inirm.set_defaults(func=inirm)
-    parser_inirm.add_argument('inifile', help='name of file')
+    parser_inirm.add_argument(
+        'inifile', nargs='+',
+        help='name of file, or a glob pattern of files, may be repeated')
     parser_inirm.add_argument('section', help='name of section')
     parser_inirm.add_argument('name', help='name')
-
+    _add_jobs_argument(parser_inirm)
+    _add_plan_argument(parser_inirm)
+
+
+def _add_iniget(subparsers):
+    parser_iniget = subparsers.add_parser(
+        'iniget',
+        help='print items of ini file')
+    parser_iniget.set_defaults(func=iniget)
+    parser_iniget.add_argument('inifile', help='name of file')
+    parser_iniget.add_argument('section', help='name of section')
+    parser_iniget.add_argument('names', nargs='+', metavar='name',
+                               help='name, may be repeated')
+    parser_iniget.add_argument(
+        '--format', choices=('raw', 'shell', 'json'), default='raw',
+        help='the values one per line (default), NAME=value lines to '
+             'eval, leaving out missing keys, or JSON')
+
+
+def _add_extract_localrc(subparsers):
     parser_extract_local = subparsers.add_parser(
         'extract-localrc',
         help='extract localrc from local.conf')
     parser_extract_local.set_defaults(func=extract_local)
     parser_extract_local.add_argument('local_conf')
     parser_extract_local.add_argument('local_rc')
+    _add_stamp_arguments(parser_extract_local)
+    _add_plan_argument(parser_extract_local)
 
+
+def _add_extract(subparsers):
     parser_extract = subparsers.add_parser(
         'extract',
         help='extract and merge config from local.conf')
@@ -111,20 +485,61 @@ def parse_args(argv):
     parser_extract.add_argument('group')
     parser_extract.add_argument('conf')
     parser_extract.add_argument('local_rc')
-
+    _add_stamp_arguments(parser_extract)
+    _add_plan_argument(parser_extract)
+
+
+def _add_extract_all(subparsers):
+    parser_extract_all = subparsers.add_parser(
+        'extract-all',
+        help='extract every meta section of a group, like post-config, '
+             'to its file')
+    parser_extract_all.set_defaults(func=extract_all)
+    parser_extract_all.add_argument('local_conf')
+    parser_extract_all.add_argument(
+        '--group', default='post-config',
+        help='group of meta sections to extract (default: post-config)')
+    _add_symbol_arguments(parser_extract_all)
+    parser_extract_all.add_argument(
+        '--jobs', type=int, default=None,
+        help='number of files written at the same time')
+
+
+def _add_targets(subparsers):
+    parser_targets = subparsers.add_parser(
+        'targets',
+        help='list the files the meta sections of local.conf are for')
+    parser_targets.set_defaults(func=targets)
+    parser_targets.add_argument('local_conf')
+    parser_targets.add_argument(
+        '--group', help='only list the meta sections of this group')
+    _add_symbol_arguments(parser_targets)
+    parser_targets.add_argument(
+        '--format', choices=('text', 'json'), default='text',
+        help='tab separated group, conf and file per line (default), '
+             'or JSON')
+
+
+def _add_setlc(subparsers):
     parser_setlc = subparsers.add_parser(
         'setlc', help='set variable in localrc of local.conf')
     parser_setlc.set_defaults(func=setlc)
     parser_setlc.add_argument('local_conf')
     parser_setlc.add_argument('name')
     parser_setlc.add_argument('value')
+    _add_plan_argument(parser_setlc)
 
+
+def _add_setlc_raw(subparsers):
     parser_setlc_raw = subparsers.add_parser(
         'setlc_raw', help='set raw line at the end of localrc in local.conf')
     parser_setlc_raw.set_defaults(func=setlc_raw)
     parser_setlc_raw.add_argument('local_conf')
     parser_setlc_raw.add_argument('items', nargs="+")
+    _add_plan_argument(parser_setlc_raw)
+
 
+def _add_setlc_conf(subparsers):
     parser_setlc_conf = subparsers.add_parser(
         'setlc_conf', help='set variable in ini section of local.conf')
     parser_setlc_conf.set_defaults(func=setlc_conf)
@@ -134,26 +549,207 @@ def parse_args(argv):
     parser_setlc_conf.add_argument('section')
     parser_setlc_conf.add_argument('name')
     parser_setlc_conf.add_argument('value')
+    _add_plan_argument(parser_setlc_conf)
+
 
+def _add_merge_lc(subparsers):
     parser_merge = subparsers.add_parser(
         'merge_lc', help='merge local.conf files')
     parser_merge.set_defaults(func=merge)
     parser_merge.add_argument('local_conf')
     parser_merge.add_argument('sources', nargs='+')
+    parser_merge.add_argument(
+        '--jobs', type=int, default=1,
+        help='number of processes parsing the sources (default: 1)')
+    _add_plan_argument(parser_merge)
+
+
+def _add_ini_apply(subparsers):
+    parser_ini_apply = subparsers.add_parser(
+        'ini-apply',
+        help='apply many ini operations, one file write per ini file')
+    parser_ini_apply.set_defaults(func=ini_apply)
+    parser_ini_apply.add_argument(
+        'operations', nargs='?', type=argparse.FileType('r'), default='-',
+        help='file with one iniset, inirm, inicomment or iniuncomment '
+             'command per line (default: stdin)')
+    _add_plan_argument(parser_ini_apply)
+
+
+def _add_apply(subparsers):
+    parser_apply = subparsers.add_parser(
+        'apply',
+        help='apply the ini and local.conf edits of a JSON or YAML file')
+    parser_apply.set_defaults(func=apply)
+    parser_apply.add_argument(
+        'edits', nargs='?', type=argparse.FileType('r'), default='-',
+        help='list of files, each with its list of operations '
+             '(default: stdin)')
+    parser_apply.add_argument(
+        '--format', choices=('json', 'yaml'),
+        help='format of the edits (default: yaml for .yaml and .yml '
+             'files, else json)')
+    _add_jobs_argument(parser_apply)
+    _add_plan_argument(parser_apply)
+
+
+def _add_serve(subparsers):
+    parser_serve = subparsers.add_parser(
+        'serve', help='serve dsconf commands on a unix socket')
+    parser_serve.set_defaults(func=serve)
+    parser_serve.add_argument('socket', help='path of the unix socket')
+    parser_serve.add_argument(
+        '--defer', action='store_true',
+        help='only write edits on "flush" and at shutdown')
+
+
+def _add_client(subparsers):
+    parser_client = subparsers.add_parser(
+        'client', help='send a command to a dsconf server')
+    parser_client.set_defaults(func=client)
+    parser_client.add_argument('socket', help='path of the unix socket')
+    parser_client.add_argument('command', nargs=argparse.REMAINDER,
+                               help='dsconf command and its arguments')
+
+
+# the functions adding the subparser of every command, in the order of
+# the help output
+COMMANDS = {
+    'iniset': _add_iniset,
+    'inicomment': _add_inicomment,
+    'iniuncomment': _add_iniuncomment,
+    'inirm': _add_inirm,
+    'iniget': _add_iniget,
+    'extract-localrc': _add_extract_localrc,
+    'extract': _add_extract,
+    'extract-all': _add_extract_all,
+    'targets': _add_targets,
+    'setlc': _add_setlc,
+    'setlc_raw': _add_setlc_raw,
+    'setlc_conf': _add_setlc_conf,
+    'merge_lc': _add_merge_lc,
+    'ini-apply': _add_ini_apply,
+    'apply': _add_apply,
+    'serve': _add_serve,
+    'client': _add_client,
+}
+
+_GLOBAL_OPTIONS = ('--fsync', '--exit-code', '--coproc', '--defer',
+                   '--profile', '--profile-log')
+# global options that take a value as the next argument
+_VALUE_OPTIONS = ('--fsync', '--profile-log')
+
+
+def build_parser(parser_class=argparse.ArgumentParser, commands=None):
+    """Return the dsconf parser, with subparsers only for commands.
+
+    All commands are added if commands is None.
+    """
+    parser = parser_class(prog='dsconf')
+    parser.add_argument(
+        '--fsync', choices=devstack.dsconf.FSYNC_POLICIES,
+        help='sync rewritten files to disk: not at all (default), the '
+             'file, or the file and its directory')
+    parser.add_argument(
+        '--exit-code', action='store_true',
+        help='exit with status %d if the command changed no file'
+             % EXIT_UNCHANGED)
+    parser.add_argument(
+        '--coproc', action='store_true',
+        help='read commands from stdin, one per line, and answer each '
+             'with "ok" or "error: <message>" on stdout')
+    parser.add_argument(
+        '--defer', action='store_true', dest='coproc_defer',
+        help='with --coproc, only write edits on "flush" and at exit')
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print the time, I/O and regular expressions of every '
+             'operation to stderr at exit')
+    parser.add_argument(
+        '--profile-log', metavar='FILE',
+        help='append them to FILE as JSON lines instead')
+    subparsers = parser.add_subparsers(title='commands',
+                                       help='sub-command help')
+    for name, add in COMMANDS.items():
+        if commands is None or name in commands:
+            add(subparsers)
+    return parser
+
+
+def _command(args):
+    """Return the command of the arguments args, if it is certain.
+
+    Global options are skipped. None is returned for anything that
+    needs the full parser: no command, help, or an argument that is
+    not known here, like an abbreviated option.
+    """
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in COMMANDS:
+            return arg
+        if arg in _VALUE_OPTIONS:
+            i += 1
+        elif (not arg.startswith('--') or arg in ('--help', '--') or
+                arg.split('=', 1)[0] not in _GLOBAL_OPTIONS):
+            return None
+        i += 1
+    return None
+
 
-    return parser.parse_args(), parser
+def parse_args(argv):
+    # dsconf is run once per edit by devstack, so only the subparser of
+    # the command is built
+    command = _command(argv[1:])
+    parser = build_parser(commands=None if command is None else (command,))
+    return parser.parse_args(argv[1:]), parser
 
 
 def main(argv=None):
     args, parser = parse_args(argv or sys.argv)
+    if args.fsync:
+        devstack.dsconf.FSYNC_POLICY = args.fsync
+    if not (args.profile or args.profile_log):
+        return run(args, parser)
+    profiler = devstack.dsconf.enable_profiling()
+    try:
+        return run(args, parser)
+    finally:
+        profiler.report(args.profile_log)
+        devstack.dsconf.disable_profiling()
+
+
+def run(args, parser):
+    if args.coproc:
+        return coproc(args)
+    if args.coproc_defer:
+        parser.error("--defer can only be used with --coproc")
+
     if hasattr(args, 'inifile'):
-        f = devstack.dsconf.IniFile(args.inifile)
+        if isinstance(args.inifile, str):
+            # iniget reads a single file
+            f = devstack.dsconf.IniFile(args.inifile)
+        elif (len(args.inifile) == 1 and
+                not glob.has_magic(args.inifile[0])):
+            f = devstack.dsconf.IniFile(args.inifile[0])
+        else:
+            # several files are edited at once, reporting on each
+            f = args.inifile
+            args.func = functools.partial(ini_all, args.func)
     elif hasattr(args, 'local_conf'):
         f = devstack.dsconf.LocalConf(args.local_conf)
+    else:
+        f = None
 
     if hasattr(args, 'func'):
-        args.func(f, args)
+        if getattr(args, 'plan', None):
+            result = run_plan(f, args)
+        else:
+            result = args.func(f, args)
+        if isinstance(result, bool):
+            # editing commands return whether they changed anything
+            result = EXIT_UNCHANGED if args.exit_code and not result else 0
+        return result
     else:
         parser.print_help()
         return 1
-    return
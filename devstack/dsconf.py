@@ -16,35 +16,997 @@
 # python ConfigFile parser because that ends up rewriting the entire
 # file and doesn't ensure comments remain.
 
+# Modules only some operations need are imported where they are used,
+# as dsconf is run thousands of times by devstack and its startup time
+# adds up.
+import atexit
+import bisect
+import contextlib
+import errno
+import functools
+import io
+import os
 import os.path
 import re
-import shutil
-import tempfile
+import stat
+import sys
+import time
 
 
-class IniFile(object):
-    """Class for manipulating ini files in place."""
+_SECTION_RE = re.compile(r"\[([^\[\]]+)\]")
+_META_RE = re.compile(r"\[\[.*\|.*\]\]")
+_META_BYTES_RE = re.compile(br"\[\[.*\|.*\]\]")
+_GROUP_RE = re.compile(r"\[\[([^\[\]]+)\|([^\[\]]+)\]\]")
+_CONF_KEY_RE = re.compile(r"(\w+)\s*\=\s*(.+)")
+_VAR_RE = re.compile(r"\$(?:\{(\w+)(?::-([^}]*))?\}|(\w+))")
+_ASSIGNMENT_RE = re.compile(r"\s*(?:export\s+)?([A-Za-z_]\w*)=(.*)")
+_UNCOMMENT_RE = re.compile(r"^#\s*")
+
+_PATTERNS = ("_SECTION_RE", "_META_RE", "_META_BYTES_RE", "_GROUP_RE",
+             "_CONF_KEY_RE", "_VAR_RE", "_ASSIGNMENT_RE", "_UNCOMMENT_RE")
+
+
+# Profiling: with DSCONF_PROFILE set, or dsconf --profile, every
+# operation of IniFile and LocalConf records its wall time, the bytes
+# it read and wrote, the files it rewrote, the temporary files it
+# created and the regular expressions it evaluated. Without it the
+# operations only check that _profiler is None.
+
+PROFILE_COUNTERS = ("bytes_read", "bytes_written", "rewrites",
+                    "temp_files", "regex_evals")
+
+
+class Profiler(object):
+    """Counters of the operations run while profiling.
+
+    An operation started while another one runs in the same thread is
+    counted as part of that one.
+    """
+
+    def __init__(self):
+        import threading
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def operation(self, name, fname):
+        """Count what happens in the block as the operation name."""
+        if getattr(self._local, "record", None) is not None:
+            yield
+            return
+        record = dict.fromkeys(PROFILE_COUNTERS, 0)
+        record.update(op=name, file=fname, start=time.time(), seconds=0.0)
+        with self._lock:
+            self.records.append(record)
+        started = time.perf_counter()
+        try:
+            with self._recording(record):
+                yield
+        finally:
+            record["seconds"] = time.perf_counter() - started
+
+    @contextlib.contextmanager
+    def _recording(self, record):
+        self._local.record = record
+        try:
+            yield
+        finally:
+            self._local.record = None
+
+    def bind(self, func):
+        """Make func count into the operation running now, in any thread."""
+        record = getattr(self._local, "record", None)
+        if record is None:
+            return func
+
+        @functools.wraps(func)
+        def _bound(*args, **kwargs):
+            with self._recording(record):
+                return func(*args, **kwargs)
+
+        return _bound
+
+    def count(self, counter, n=1):
+        record = getattr(self._local, "record", None)
+        if record is not None:
+            with self._lock:
+                record[counter] += n
+
+    def summary(self):
+        """Return a table of the counters summed up per operation."""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["op"], dict.fromkeys(
+                ("calls", "seconds") + PROFILE_COUNTERS, 0))
+            total["calls"] += 1
+            for counter in ("seconds",) + PROFILE_COUNTERS:
+                total[counter] += record.get(counter, 0)
+        lines = ["%-24s %6s %9s %11s %11s %8s %5s %11s" % (
+            "operation", "calls", "seconds", "read", "written", "rewrites",
+            "temps", "regexes")]
+        for op, total in sorted(totals.items()):
+            lines.append("%-24s %6d %9.4f %11d %11d %8d %5d %11d" % (
+                op, total["calls"], total["seconds"], total["bytes_read"],
+                total["bytes_written"], total["rewrites"],
+                total["temp_files"], total["regex_evals"]))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, fname):
+        """Append one JSON line per operation to the file fname."""
+        import json
+        with open(fname, "a") as f:
+            for record in self.records:
+                f.write(json.dumps(dict(record, pid=os.getpid()),
+                                   sort_keys=True) + "\n")
+
+    def report(self, log=None):
+        """Append the records to log, or print the summary to stderr."""
+        if log:
+            self.write_json(log)
+        else:
+            sys.stderr.write(self.summary())
+
+
+class _CountingPattern(object):
+    """Compiled pattern counting its evaluations into the profiler."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def match(self, *args):
+        _count("regex_evals")
+        return self.pattern.match(*args)
+
+    def sub(self, *args):
+        _count("regex_evals")
+        return self.pattern.sub(*args)
+
+
+class _CountingReader(object):
+    """File to read from, counting the bytes read into the profiler."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def _counted(self, text):
+        _count("bytes_read", len(text.encode()))
+        return text
+
+    def read(self, size=-1):
+        return self._counted(self._f.read(size))
+
+    def __iter__(self):
+        for line in self._f:
+            yield self._counted(line)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+_profiler = None
+
+
+def _count(counter, n=1):
+    if _profiler is not None:
+        _profiler.count(counter, n)
+
+
+def enable_profiling():
+    """Start profiling the operations, returning the Profiler."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        for name in _PATTERNS:
+            globals()[name] = _CountingPattern(globals()[name])
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    if _profiler is not None:
+        _profiler = None
+        for name in _PATTERNS:
+            globals()[name] = globals()[name].pattern
+
+
+def _operation(func):
+    """Profile calls of an IniFile or LocalConf method as operations."""
+    @functools.wraps(func)
+    def _call(self, *args, **kwargs):
+        if _profiler is None:
+            return func(self, *args, **kwargs)
+        with _profiler.operation(
+                "%s.%s" % (type(self).__name__, func.__name__), self.fname):
+            return func(self, *args, **kwargs)
+    return _call
+
+
+def _generator_operation(func):
+    """_operation for generators, like the ones of batch()."""
+    @functools.wraps(func)
+    def _generator(self, *args, **kwargs):
+        if _profiler is None:
+            return (yield from func(self, *args, **kwargs))
+        with _profiler.operation(
+                "%s.%s" % (type(self).__name__, func.__name__), self.fname):
+            return (yield from func(self, *args, **kwargs))
+    return _generator
+
+
+def _profile_from_env():
+    """Profile this process as DSCONF_PROFILE says, if it is set.
+
+    "1" or "stderr" prints a summary to stderr at exit, anything else
+    is a file JSON lines are appended to.
+    """
+    target = os.environ.get("DSCONF_PROFILE")
+    if target:
+        profiler = enable_profiling()
+        atexit.register(profiler.report,
+                        None if target in ("1", "stderr") else target)
+
+
+class SymbolTable(object):
+    """Values of the shell variables used in local.conf.
+
+    The table can be filled from the environment, from shell
+    assignments like the localrc section of a local.conf or a file of
+    NAME=VALUE lines, and from a mapping; whatever is added last wins.
+    Resolved texts are cached until the table changes.
+    """
+
+    def __init__(self, variables=None):
+        self._values = dict(variables or {})
+        self._cache = {}
+
+    def update(self, variables):
+        self._values.update(variables)
+        self._cache.clear()
+        return self
+
+    def read_env(self, environ=None):
+        return self.update(os.environ if environ is None else environ)
+
+    def read_shell(self, lines):
+        """Add the variables assigned by shell lines, in order.
+
+        Values are expanded when assigned, like the shell does, with
+        undefined variables expanding to nothing; single quoted values
+        are taken as they are. Lines that are not assignments are
+        skipped.
+        """
+        for line in lines:
+            m = _ASSIGNMENT_RE.match(line)
+            if not m:
+                continue
+            value = m.group(2).strip()
+            if len(value) > 1 and value[0] == value[-1] == "'":
+                value = value[1:-1]
+            else:
+                if len(value) > 1 and value[0] == value[-1] == '"':
+                    value = value[1:-1]
+                else:
+                    value = value.split(" #")[0].rstrip()
+                value = self._expand(value, strict=False)
+            self.update({m.group(1): value})
+        return self
+
+    def read_file(self, fname):
+        with open(fname) as f:
+            return self.read_shell(f)
+
+    def read_localrc(self, fname):
+        """Add the variables set in the localrc of the local.conf fname."""
+        return self.read_shell(
+            LocalConfDocument.load(fname).section("local", "localrc"))
+
+    def _expand(self, text, strict):
+        def _value(m):
+            name = m.group(1) or m.group(3)
+            value = self._values.get(name)
+            if not value and m.group(2) is not None:
+                return self._expand(m.group(2), strict)
+            if value is None:
+                if strict:
+                    raise KeyError(name)
+                return ""
+            return value
+
+        return _VAR_RE.sub(_value, text)
+
+    def resolve(self, text):
+        """Replace $NAME, ${NAME} and ${NAME:-default} in text.
+
+        Raises KeyError for an undefined name without a default.
+        """
+        try:
+            return self._cache[text]
+        except KeyError:
+            pass
+        result = self._cache[text] = self._expand(text, strict=True)
+        return result
+
+
+def expand_vars(text, variables):
+    """Replace $NAME and ${NAME} in text with their value in variables.
+
+    Raises KeyError for a name that is not in variables.
+    """
+    return SymbolTable(variables).resolve(text)
+
+
+def _key_name(line):
+    """Return the key set by a ``name = value`` line, or None."""
+    idx = line.find("=")
+    if idx < 0:
+        return None
+    return line[:idx].rstrip()
+
+
+def _key_value(line):
+    """Return the value set by a ``name = value`` line."""
+    return line[line.find("=") + 1:].strip()
+
+
+def _commented_key_name(line):
+    """Return the key set by a ``# name = value`` line, or None."""
+    if not line.startswith("#"):
+        return None
+    return _key_name(line[1:].lstrip())
+
+
+class _IniSection(object):
+    """A single section of an ini file with an index of its keys.
+
+    The preamble before the first section header is a section named
+    "" without a header line.
+    """
+
+    def __init__(self, name, header=None):
+        self.name = name
+        self.header = header
+        self.lines = []
+        self._keys = None
+        self._commented = None
+
+    def _build_index(self):
+        self._keys = {}
+        self._commented = {}
+        for lineno, line in enumerate(self.lines):
+            key = _key_name(line)
+            if key is not None:
+                self._keys.setdefault(key, []).append(lineno)
+            key = _commented_key_name(line)
+            if key is not None:
+                self._commented.setdefault(key, []).append(lineno)
+
+    def find(self, name, commented=False):
+        """Return the line numbers in the section that set name."""
+        if self._keys is None:
+            self._build_index()
+        index = self._commented if commented else self._keys
+        return index.get(name, [])
+
+    def all_lines(self):
+        """Yield the header, if any, and the lines of the section."""
+        if self.header is not None:
+            yield self.header
+        for line in self.lines:
+            yield line
+
+    def insert(self, lineno, line):
+        self.lines.insert(lineno, line)
+        self._keys = None
+
+    def add(self, line):
+        """Add line at the beginning of the section.
+
+        Returns False for the preamble, which has no header to add
+        after.
+        """
+        if self.header is None:
+            return False
+        if self.header.endswith("\n"):
+            self.insert(0, line)
+        else:
+            # a header without a newline ends the file, anything
+            # written after it becomes part of the header line.
+            self.header += line
+        return True
+
+    def replace(self, name, func, commented=False):
+        """Replace every line setting name with func(line).
+
+        If func returns None the line is dropped. Returns True if any
+        line changed.
+        """
+        changed = False
+        for lineno in reversed(self.find(name, commented)):
+            old = self.lines[lineno]
+            line = func(old)
+            if line != old:
+                self.lines[lineno:lineno + 1] = [] if line is None else [line]
+                changed = True
+        if changed:
+            self._keys = None
+        return changed
+
+
+def _walk(lines, section):
+    """Yield (line, state) for lines, following the section named section.
+
+    state is None for lines outside of that section, "header" for its
+    header lines and "body" for the lines in it. Nothing but the
+    current line is held in memory.
+    """
+    inside = section == ""
+    for line in lines:
+        m = _SECTION_RE.match(line)
+        if m:
+            inside = m.group(1) == section
+            yield line, "header" if inside else None
+        else:
+            yield line, "body" if inside else None
+
+
+def _sibling_temp(fname):
+    """Create an empty file next to fname, returning its path and writer.
+
+    The file is created with the default mode open() would give fname,
+    so a new fname gets the usual umask derived mode.
+    """
+    dirname, basename = os.path.split(fname)
+    while True:
+        name = os.path.join(dirname, ".%s.%s" % (basename,
+                                                 os.urandom(4).hex()))
+        try:
+            fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        _count("temp_files")
+        return name, os.fdopen(fd, "w")
+
+
+class _ComparingWriter(object):
+    """Writer that tracks whether it writes what original already holds.
+
+    original is the old content opened with newline="", or None for a
+    file that does not exist yet, which always counts as a change.
+    """
+
+    def __init__(self, writer, original):
+        self._writer = writer
+        self._original = original
+        self.changed = original is None
+
+    def write(self, text):
+        if not self.changed and self._original.read(len(text)) != text:
+            self.changed = True
+        if _profiler is not None:
+            _count("bytes_written", len(text.encode()))
+        return self._writer.write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def finish(self):
+        """Note a change if the old content was longer."""
+        if not self.changed and self._original.read(1):
+            self.changed = True
+
+
+# How hard to make sure a rewritten file is on disk before returning:
+# "none" leaves it to the kernel, "file" fsyncs the new file before it
+# replaces the old one, and "file+dir" also fsyncs the directory so
+# the rename itself survives a crash.
+FSYNC_POLICIES = ("none", "file", "file+dir")
+FSYNC_POLICY = os.environ.get("DSCONF_FSYNC", "none")
+
+
+def _fsync_dir(dirname):
+    fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Plan(object):
+    """Files dsconf would have written, with their old and new content.
+
+    While planning() is active, every file that would be rewritten is
+    recorded here instead and left untouched on disk.
+    """
+
+    def __init__(self):
+        import threading
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def record(self, fname, old, new):
+        """Note that fname, holding old or None, would get new."""
+        with self._lock:
+            entry = self._files.setdefault(os.path.realpath(fname),
+                                           [fname, old, new])
+            entry[2] = new
 
-    def __init__(self, fname):
+    def content(self, fname):
+        """Return what fname would hold, or None if it is not planned."""
+        with self._lock:
+            entry = self._files.get(os.path.realpath(fname))
+            return None if entry is None else entry[2]
+
+    def changes(self):
+        """Return (fname, old, new) of every file that would change.
+
+        old is None for a file that would be created.
+        """
+        with self._lock:
+            return [tuple(entry) for entry in self._files.values()
+                    if entry[1] != entry[2]]
+
+    def diff(self):
+        """Return the changes as a unified diff."""
+        import difflib
+        out = []
+        for fname, old, new in self.changes():
+            for line in difflib.unified_diff(
+                    (old or "").splitlines(True), new.splitlines(True),
+                    "/dev/null" if old is None else fname, fname):
+                if not line.endswith("\n"):
+                    line += "\n\\ No newline at end of file\n"
+                out.append(line)
+        return "".join(out)
+
+    def edits(self):
+        """Return the changes as a list of dicts, ready for JSON.
+
+        Every file has a list of edits, each replacing, inserting or
+        deleting the old lines at a line number of the old content.
+        """
+        import difflib
+        result = []
+        for fname, old, new in self.changes():
+            a = (old or "").splitlines(True)
+            b = new.splitlines(True)
+            matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+            edits = [
+                {"op": tag, "line": i1 + 1, "old": a[i1:i2],
+                 "new": b[j1:j2]}
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                if tag != "equal"]
+            result.append({"file": fname, "created": old is None,
+                           "edits": edits})
+        return result
+
+
+_plan = None
+
+
+@contextlib.contextmanager
+def planning():
+    """Compute edits without writing anything; yields their Plan."""
+    global _plan
+    previous, _plan = _plan, Plan()
+    try:
+        yield _plan
+    finally:
+        _plan = previous
+
+
+def _exists(fname):
+    """os.path.exists(), counting the files a plan would write."""
+    if _plan is not None and _plan.content(fname) is not None:
+        return True
+    return os.path.exists(fname)
+
+
+def _open(fname, newline=None):
+    """Open fname for reading, as a plan would leave it."""
+    if _plan is not None:
+        content = _plan.content(fname)
+        if content is not None:
+            return io.StringIO(content, newline=newline)
+    if _profiler is not None:
+        return _CountingReader(open(fname, newline=newline))
+    return open(fname, newline=newline)
+
+
+def _read_text(fname):
+    """Return the content of fname, or None if it does not exist."""
+    try:
+        with _open(fname, newline="") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class _PlanWriter(object):
+
+    def __init__(self):
+        self.parts = []
+        self.changed = False
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def writelines(self, lines):
+        self.parts.extend(lines)
+
+
+@contextlib.contextmanager
+def _planned_file(plan, fname):
+    writer = _PlanWriter()
+    yield writer
+    old = _read_text(fname)
+    new = "".join(writer.parts)
+    writer.changed = new != old
+    plan.record(fname, old, new)
+
+
+@contextlib.contextmanager
+def _replace_file(fname, fsync=None):
+    """Yield a writer for the new content of fname.
+
+    The content is written to a temporary file next to fname, which
+    then replaces it with os.replace(), so fname can be streamed from
+    while its new version is written and readers never see a partial
+    or empty file. Symlinks are followed, and the mode and ownership of
+    an existing fname are kept. If no file can be created next to
+    fname the new content is copied over it instead.
+
+    If the new content turns out to be identical to the old one, fname
+    is not touched at all. The writer's changed attribute tells which
+    case happened once the block is done.
+
+    fsync is one of FSYNC_POLICIES, by default FSYNC_POLICY.
+
+    While planning(), the new content goes to the Plan instead.
+    """
+    fsync = fsync or FSYNC_POLICY
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError("unknown fsync policy %r" % fsync)
+    if _plan is not None:
+        with _planned_file(_plan, fname) as writer:
+            yield writer
+        return
+    fname = os.path.realpath(fname)
+    try:
+        st = os.stat(fname)
+    except FileNotFoundError:
+        st = None
+    try:
+        tmp, writer = _sibling_temp(fname)
+        in_place = False
+    except PermissionError:
+        import tempfile
+        fd, tmp = tempfile.mkstemp()
+        _count("temp_files")
+        writer = os.fdopen(fd, "w")
+        in_place = True
+    try:
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(writer)
+            original = None
+            if st is not None:
+                original = stack.enter_context(_open(fname, newline=""))
+            compare = _ComparingWriter(writer, original)
+            yield compare
+            compare.finish()
+            writer.flush()
+            if compare.changed and fsync != "none" and not in_place:
+                os.fsync(writer.fileno())
+        if not compare.changed:
+            os.unlink(tmp)
+            return
+        _count("rewrites")
+        if in_place:
+            import shutil
+            shutil.copyfile(tmp, fname)
+            os.unlink(tmp)
+            if fsync != "none":
+                with open(fname, "a") as f:
+                    os.fsync(f.fileno())
+            return
+        if st is not None:
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+            new = os.stat(tmp)
+            if (new.st_uid, new.st_gid) != (st.st_uid, st.st_gid):
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+        os.replace(tmp, fname)
+        if fsync == "file+dir":
+            _fsync_dir(os.path.dirname(fname))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class _Restart(Exception):
+    """A streaming edit found it has to start over."""
+
+
+class IniDocument(object):
+    """Parsed, section indexed ini file.
+
+    The file is parsed once into sections, and each section keeps an
+    index of the keys it contains, so lookups and edits only touch
+    the sections involved. All lines are kept verbatim so that
+    writing the document back preserves comments and layout.
+
+    A document created without lines stands for a file that does not
+    exist yet: like IniFile, it refuses edits of existing keys until
+    something has been added to it.
+
+    Like those of IniFile, the edit methods return True if they changed
+    anything, and changed tells whether the document differs from what
+    was loaded or last saved.
+    """
+
+    def __init__(self, lines=None, fname=None):
         self.fname = fname
+        self.exists = lines is not None
+        self.changed = False
+        self.sections = []
+        self._index = {}
+        self._append(_IniSection(""))
+        self._feed(lines or ())
+
+    @classmethod
+    def load(cls, fname):
+        with _open(fname) as reader:
+            return cls(reader, fname)
+
+    def save(self, fname=None, fsync=None):
+        """Write the document to fname, or back where it came from.
+
+        The file is replaced atomically, like all IniFile edits, and
+        synced to disk according to the fsync policy. If the file
+        already has this content it is left alone. Returns True if the
+        file was written.
+        """
+        with _replace_file(fname or self.fname, fsync) as writer:
+            writer.writelines(self.lines())
+        self.changed = False
+        return writer.changed
+
+    def lines(self):
+        """Yield every line of the document."""
+        for section in self.sections:
+            for line in section.all_lines():
+                yield line
+
+    def _append(self, section):
+        self.sections.append(section)
+        self._index.setdefault(section.name, []).append(section)
+
+    def _feed(self, lines):
+        """Parse lines onto the end of the document."""
+        section = self.sections[-1]
+        section._keys = None
+        for line in lines:
+            m = _SECTION_RE.match(line)
+            if m:
+                section = _IniSection(m.group(1), line)
+                self._append(section)
+            else:
+                section.lines.append(line)
+
+    def _append_text(self, text):
+        """Append text as if it was written to the end of the file.
+
+        If the file does not end with a newline the first line of text
+        is joined onto its last line, exactly as it would be when the
+        file is written out and parsed again.
+        """
+        last = self.sections[-1]
+        tail = ""
+        if last.lines:
+            if not last.lines[-1].endswith("\n"):
+                tail = last.lines.pop()
+        elif last.header is not None and not last.header.endswith("\n"):
+            tail = last.header
+            self.sections.pop()
+            self._index[last.name].remove(last)
+        self._feed((tail + text).splitlines(True))
 
     def has(self, section, name):
         """Returns True if section has a key that is name"""
+        return any(s.find(name) for s in self._index.get(section, ()))
 
-        current_section = ""
-        if not os.path.exists(self.fname):
+    def get(self, section, name, default=None):
+        """Return the value of the key name in section, or default.
+
+        If the key is set more than once the last setting wins, as it
+        does for oslo.config.
+        """
+        value = default
+        for s in self._index.get(section, ()):
+            found = s.find(name)
+            if found:
+                value = _key_value(s.lines[found[-1]])
+        return value
+
+    def get_many(self, section, names, default=None):
+        """Return a dict of the keys names in section to their values."""
+        return {name: self.get(section, name, default) for name in names}
+
+    def add(self, section, name, value):
+        """add a key / value at the beginning of every matching section.
+
+        If no section is found a new section is appended.
+        """
+        line = "%s = %s\n" % (name, value)
+        self.exists = True
+        self.changed = True
+        found = False
+        for s in self._index.get(section, ()):
+            found = s.add(line) or found
+        if not found:
+            self._append_text("[%s]\n%s" % (section, line))
+        return True
+
+    def _at_existing_key(self, section, name, func, commented=False):
+        """Replace every line setting name in section with func(line)."""
+        if not self.exists:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    self.fname)
+        changed = False
+        for s in self._index.get(section, ()):
+            changed = s.replace(name, func, commented) or changed
+        self.changed = self.changed or changed
+        return changed
+
+    def set(self, section, name, value):
+        """set a key / value in a section.
+
+        Every existing setting of the key in the section is replaced,
+        if there is none the key is added as add() does.
+        """
+        line = "%s = %s\n" % (name, value)
+        found = [s for s in self._index.get(section, ()) if s.find(name)]
+        if not found:
+            return self.add(section, name, value)
+        changed = False
+        for s in found:
+            changed = s.replace(name, lambda old: line) or changed
+        self.changed = self.changed or changed
+        return changed
+
+    def remove(self, section, name):
+        """remove a key / value from a section."""
+        return self._at_existing_key(section, name, lambda line: None)
+
+    def comment(self, section, name):
+        return self._at_existing_key(section, name,
+                                     lambda line: "# %s" % line)
+
+    def uncomment(self, section, name):
+        return self._at_existing_key(
+            section, name, lambda line: _UNCOMMENT_RE.sub("", line),
+            commented=True)
+
+
+class IniFile(object):
+    """Class for manipulating ini files in place.
+
+    Every edit streams the file, one line at a time, into a new file
+    that then replaces it, so memory use depends neither on the size of
+    the file nor on the size of its sections. Use batch() to make
+    several edits with a single read and write.
+
+    Edits return True if they changed the file. An edit that leaves the
+    content as it was does not write the file at all, so its mtime is
+    kept.
+    """
+
+    def __init__(self, fname, fsync=None):
+        self.fname = fname
+        self.fsync = fsync
+
+    def _document(self, missing_ok=False):
+        """Parse the file into an IniDocument.
+
+        NOTE(sdague): if the file isn't found, we end up
+        exploding. This seems like the right behavior in nearly all
+        circumstances.
+
+        """
+        if missing_ok and not _exists(self.fname):
+            return IniDocument(fname=self.fname)
+        return IniDocument.load(self.fname)
+
+    @contextlib.contextmanager
+    @_generator_operation
+    def batch(self):
+        """Apply many edits with a single read and a single write.
+
+        Yields an IniDocument supporting the same edit methods as
+        IniFile. The edits are made in memory and the file is written
+        once when the block exits, if anything changed; if the block
+        raises, the file is left untouched.
+
+            with IniFile(path).batch() as b:
+                b.set("DEFAULT", "debug", "True")
+                b.remove("DEFAULT", "verbose")
+        """
+        doc = self._document(missing_ok=True)
+        yield doc
+        if doc.changed:
+            doc.save(self.fname, self.fsync)
+
+    def _rewrite(self, section, func, append=None):
+        """Stream the file into its new version, line by line.
+
+        func(line, header) is called for every line of the sections
+        named section, header telling whether it is the header line,
+        and returns the text to write in its place. If given, append()
+        returns text to write at the end of the file. Returns True if
+        the file changed.
+        """
+        with _open(self.fname) as reader, \
+                _replace_file(self.fname, self.fsync) as writer:
+            for line, state in _walk(reader, section):
+                if state is not None:
+                    line = func(line, state == "header")
+                writer.write(line)
+            if append is not None:
+                writer.write(append())
+        return writer.changed
+
+    @_operation
+    def has(self, section, name):
+        """Returns True if section has a key that is name"""
+        if not _exists(self.fname):
             return False
+        with _open(self.fname) as reader:
+            return any(state == "body" and _key_name(line) == name
+                       for line, state in _walk(reader, section))
 
-        with open(self.fname, "r+") as reader:
-            for line in reader.readlines():
-                m = re.match(r"\[([^\[\]]+)\]", line)
-                if m:
-                    current_section = m.group(1)
-                if current_section == section:
-                    if re.match(r"%s\s*\=" % name, line):
-                        return True
-        return False
+    @_operation
+    def get(self, section, name, default=None):
+        """Return the value of the key name in section, or default.
+
+        A missing file has no keys, as for has().
+        """
+        return self._document(missing_ok=True).get(section, name, default)
+
+    @_operation
+    def get_many(self, section, names, default=None):
+        """Return a dict of the keys names in section to their values.
 
+        The file is parsed once for all of them.
+        """
+        return self._document(missing_ok=True).get_many(section, names,
+                                                        default)
+
+    def _add(self, section, line):
+        found = []
+
+        def _do_add(old, header):
+            if header:
+                found.append(True)
+                return old + line
+            return old
+
+        def _append():
+            return "" if found else "[%s]\n%s" % (section, line)
+
+        if not _exists(self.fname):
+            with _replace_file(self.fname, self.fsync) as writer:
+                writer.write(_append())
+            return True
+        return self._rewrite(section, _do_add, _append)
+
+    @_operation
     def add(self, section, name, value):
         """add a key / value to an ini file in a section.
 
@@ -52,280 +1014,1260 @@ class IniFile(object):
         section, if no section is found a new section and key value
         will be added to the end of the file.
         """
-        temp = tempfile.NamedTemporaryFile(mode='r')
-        if os.path.exists(self.fname):
-            shutil.copyfile(self.fname, temp.name)
+        return self._add(section, "%s = %s\n" % (name, value))
+
+    def _at_existing_key(self, section, name, func, commented=False):
+        """Run a function at every line setting name in section.
+
+        The line is replaced by what func returns, or dropped if it
+        returns None. Raises if the file doesn't exist.
+        """
+        key_name = _commented_key_name if commented else _key_name
+
+        def _do_edit(line, header):
+            if header or key_name(line) != name:
+                return line
+            line = func(line)
+            return "" if line is None else line
+
+        return self._rewrite(section, _do_edit)
+
+    @_operation
+    def remove(self, section, name):
+        """remove a key / value from an ini file in a section."""
+        return self._at_existing_key(section, name, lambda line: None)
+
+    @_operation
+    def comment(self, section, name):
+        return self._at_existing_key(section, name,
+                                     lambda line: "# %s" % line)
+
+    @_operation
+    def uncomment(self, section, name):
+        return self._at_existing_key(
+            section, name, lambda line: _UNCOMMENT_RE.sub("", line),
+            commented=True)
+
+    @_operation
+    def set(self, section, name, value):
+        """set a key / value in a section in a single pass.
+
+        The key is optimistically added after the first header of the
+        section. If a setting of the key turns up after that, the pass
+        is abandoned and the file is streamed once more, replacing
+        the existing settings instead.
+        """
+        line = "%s = %s\n" % (name, value)
+        state = {"added": False, "replaced": False}
+
+        def _upsert(old, header):
+            if header:
+                if state["replaced"]:
+                    return old
+                state["added"] = True
+                return old + line
+            if _key_name(old) != name:
+                return old
+            if state["added"]:
+                raise _Restart()
+            state["replaced"] = True
+            return line
+
+        def _append():
+            if state["added"] or state["replaced"]:
+                return ""
+            return "[%s]\n%s" % (section, line)
+
+        if not _exists(self.fname):
+            return self._add(section, line)
+        try:
+            return self._rewrite(section, _upsert, _append)
+        except _Restart:
+            return self._at_existing_key(section, name, lambda old: line)
+
+
+def _concurrently(calls, max_workers=None):
+    """Run the callables of the dict calls in up to max_workers threads.
+
+    Returns a dict of the same keys, in order, to what the callables
+    returned, or to the exception they raised.
+    """
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        futures = [(key, pool.submit(call)) for key, call in calls.items()]
+    results = {}
+    for key, future in futures:
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            results[key] = e
+    return results
+
+
+def edit_all(fnames, edit, fsync=None, max_workers=None):
+    """Call edit with an IniFile of each file of fnames, concurrently.
+
+    The files are edited by up to max_workers threads, each file by a
+    single thread; a file named more than once, also through links, is
+    only edited for its first name.
+
+    Returns a dict of the files, in order, to what edit returned for
+    them, or to the exception it raised.
+    """
+    unique = {}
+    for fname in fnames:
+        unique.setdefault(os.path.realpath(fname), fname)
+
+    return _concurrently(
+        {fname: functools.partial(edit, IniFile(fname, fsync))
+         for fname in unique.values()}, max_workers)
+
+
+class _LcSection(object):
+    """An ini section inside a local.conf meta section.
+
+    The lines of the meta section before its first ini section header
+    are a section without a header. The section keeps a lazy index of
+    the keys set in it, leading whitespace ignored, and of its lines
+    starting with "[".
+    """
+
+    def __init__(self, header=None):
+        self.header = header
+        self.lines = []
+        self._keys = None
+        self._brackets = None
+
+    def _build_index(self):
+        self._keys = {}
+        self._brackets = []
+        for lineno, line in enumerate(self.lines):
+            self._index_line(lineno, line)
+
+    def _index_line(self, lineno, line):
+        key = _key_name(line.lstrip())
+        if key is not None:
+            self._keys.setdefault(key, []).append(lineno)
+        if line.startswith("["):
+            self._brackets.append(lineno)
+
+    def brackets(self):
+        """Return the line numbers of lines starting with "["."""
+        if self._brackets is None:
+            self._build_index()
+        return self._brackets
+
+    def find(self, name, start=0, end=None):
+        """Return the first line number in start:end setting name."""
+        if end is None:
+            end = len(self.lines)
+        if "=" in name or name != name.strip():
+            # not something the index can answer
+            key_re = re.compile(r"\s*%s\s*\=" % re.escape(name))
+            for lineno in range(start, end):
+                if key_re.match(self.lines[lineno]):
+                    return lineno
+            return None
+        if self._keys is None:
+            self._build_index()
+        found = self._keys.get(name, [])
+        i = bisect.bisect_left(found, start)
+        if i < len(found) and found[i] < end:
+            return found[i]
+        return None
+
+    def all_lines(self):
+        if self.header is not None:
+            yield self.header
+        for line in self.lines:
+            yield line
+
+    def append(self, line):
+        self.lines.append(line)
+        if self._keys is not None:
+            self._index_line(len(self.lines) - 1, line)
+
+    def replace(self, lineno, line):
+        old = self.lines[lineno]
+        self.lines[lineno] = line
+        if self._keys is None:
+            return
+        if old.startswith("[") or line.startswith("["):
+            self._keys = self._brackets = None
+            return
+        key = _key_name(old.lstrip())
+        if key is not None:
+            self._keys[key].remove(lineno)
+        key = _key_name(line.lstrip())
+        if key is not None:
+            bisect.insort(self._keys.setdefault(key, []), lineno)
+
+
+class _MetaSection(object):
+    """A [[group|conf]] meta section of a local.conf.
+
+    The preamble before the first meta section header is a meta
+    section without a header.
+    """
+
+    def __init__(self, header=None):
+        self.header = header
+        self.sections = [_LcSection()]
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget the indexes, after sections or "[[" lines changed."""
+        self._named = None
+        self._strays = None
+
+    def first_section(self, name):
+        """Return the index of the first section called name, or None."""
+        if self._named is None:
+            self._named = {}
+            for i, section in enumerate(self.sections):
+                if section.header is not None:
+                    self._named.setdefault(
+                        _SECTION_RE.match(section.header).group(1), i)
+        return self._named.get(name)
+
+    def strays(self):
+        """Return (section, lineno) of the lines starting with "[["."""
+        if self._strays is None:
+            self._strays = [
+                (i, lineno) for i, section in enumerate(self.sections)
+                for lineno in section.brackets()
+                if section.lines[lineno].startswith("[[")]
+        return self._strays
+
+    def matches(self, group, conf):
+        return (self.header is not None and
+                self.header.startswith("[[%s|%s]]" % (group, conf)))
+
+    def all_lines(self):
+        if self.header is not None:
+            yield self.header
+        for section in self.sections:
+            for line in section.all_lines():
+                yield line
+
+
+def _plain_line(text):
+    """Return True if text is a single line that is not a header."""
+    return (text.find("\n") == len(text) - 1 and
+            not _META_RE.match(text) and not _SECTION_RE.match(text))
+
+
+def _parse_meta_sections(lines, first):
+    """Split lines into meta sections, continuing the section first."""
+    metas = [first]
+    for line in lines:
+        if _META_RE.match(line):
+            metas.append(_MetaSection(line))
+        elif _SECTION_RE.match(line):
+            metas[-1].sections.append(_LcSection(line))
         else:
-            with open(temp.name, "w+"):
-                pass
+            metas[-1].sections[-1].lines.append(line)
+    return metas
 
-        found = False
-        with open(self.fname, "w+") as writer:
-            with open(temp.name) as reader:
-                for line in reader.readlines():
-                    writer.write(line)
-                    m = re.match(r"\[([^\[\]]+)\]", line)
-                    if m and m.group(1) == section:
-                        found = True
-                        writer.write("%s = %s\n" % (name, value))
-            if not found:
-                writer.write("[%s]\n" % section)
-                writer.write("%s = %s\n" % (name, value))
-
-    def _at_existing_key(self, section, name, func, match=r"%s\s*\="):
-        """Run a function at a found key.
 
-        NOTE(sdague): if the file isn't found, we end up
-        exploding. This seems like the right behavior in nearly all
-        circumstances.
+class LocalConfDocument(object):
+    """Parsed local.conf, indexed by meta section.
+
+    The file is read once and split into its [[group|conf]] meta
+    sections, and those into their ini sections, each keeping an index
+    of the keys set in it. Lookups and the insertion points of edits
+    are found from that structure instead of rescanning the file, and
+    all lines are kept verbatim, so the document is written back
+    exactly as LocalConf would have edited the file.
+
+    A document created without lines stands for a file that does not
+    exist yet. The edit methods return True if they changed anything.
+    """
+
+    def __init__(self, lines=None, fname=None):
+        self.fname = fname
+        self.exists = lines is not None
+        self.changed = False
+        self.metas = _parse_meta_sections(lines or (), _MetaSection())
+        self._groups = None
+
+    @classmethod
+    def load(cls, fname):
+        with _open(fname) as reader:
+            return cls(reader, fname)
 
+    def save(self, fname=None, fsync=None):
+        """Write the document to fname, or back where it came from.
+
+        Returns True if the file was written.
         """
-        temp = tempfile.NamedTemporaryFile(mode='r')
-        shutil.copyfile(self.fname, temp.name)
+        with _replace_file(fname or self.fname, fsync) as writer:
+            writer.writelines(self.lines())
+        self.changed = False
+        return writer.changed
+
+    def lines(self):
+        """Yield every line of the document."""
+        for meta in self.metas:
+            for line in meta.all_lines():
+                yield line
+
+    def groups(self):
+        """Return a list of all (group, conf) meta sections."""
+        if self._groups is None:
+            self._groups = []
+            for meta in self.metas:
+                m = meta.header is not None and _GROUP_RE.match(meta.header)
+                if m:
+                    self._groups.append((m.group(1), m.group(2)))
+        return list(self._groups)
+
+    def has_local_section(self):
+        return ("local", "localrc") in self.groups()
+
+    def section(self, group, conf):
+        """Yield all the lines out of a meta section."""
+        for meta in self.metas:
+            if meta.matches(group, conf):
+                for section in meta.sections:
+                    for line in section.all_lines():
+                        yield line
+
+    def conf(self, group, conf):
+        """Yield (section, name, value) set in a meta section."""
         current_section = ""
-        with open(temp.name) as reader:
-            with open(self.fname, "w+") as writer:
-                for line in reader.readlines():
-                    m = re.match(r"\[([^\[\]]+)\]", line)
+        for meta in self.metas:
+            if not meta.matches(group, conf):
+                continue
+            for section in meta.sections:
+                if section.header is not None:
+                    current_section = _SECTION_RE.match(
+                        section.header).group(1)
+                for line in section.lines:
+                    m = _CONF_KEY_RE.match(line)
                     if m:
-                        current_section = m.group(1)
-                    if current_section == section:
-                        if re.match(match % name, line):
-                            # run function with writer and found line
-                            func(writer, line)
-                        else:
-                            writer.write(line)
-                    else:
-                        writer.write(line)
+                        yield current_section, m.group(1), m.group(2)
 
-    def remove(self, section, name):
-        """remove a key / value from an ini file in a section."""
-        def _do_remove(writer, line):
-            pass
+    def _splice(self, meta, section, lineno, text, drop=0):
+        """Put text before line lineno of section, dropping drop lines.
 
-        self._at_existing_key(section, name, _do_remove)
+        meta and section are indexes into metas and its sections, a
+        lineno of None means the end of the section.
+        """
+        self.changed = True
+        old = self.metas[meta]
+        sec = old.sections[section]
+        if lineno is None:
+            lineno = len(sec.lines)
+        if lineno == len(sec.lines) and not drop:
+            if sec.lines:
+                last = sec.lines[-1]
+            elif sec.header is not None:
+                last = sec.header
+            else:
+                last = old.header
+            if ((last is None or last.endswith("\n")) and
+                    text.endswith("\n")):
+                self._append_after(meta, section, text)
+                return
+        # anything else may change the structure, so parse the meta
+        # section again, which also joins text onto a last line
+        # without a newline just like writing it to the file would.
+        lines = []
+        if old.header is not None:
+            lines.append(old.header)
+        for s in old.sections[:section]:
+            lines.extend(s.all_lines())
+        if sec.header is not None:
+            lines.append(sec.header)
+        lines.extend(sec.lines[:lineno])
+        lines.append(text)
+        lines.extend(sec.lines[lineno + drop:])
+        for s in old.sections[section + 1:]:
+            lines.extend(s.all_lines())
+        text = "".join(lines).splitlines(True)
+        if old.header is None:
+            new = _parse_meta_sections(text, _MetaSection())
+        else:
+            new = _parse_meta_sections(text, None)[1:]
+        self.metas[meta:meta + 1] = new
+        self._groups = None
 
-    def comment(self, section, name):
-        def _do_comment(writer, line):
-            writer.write("# %s" % line)
+    def _append_after(self, meta, section, text):
+        """Add whole lines of text at the end of a section.
 
-        self._at_existing_key(section, name, _do_comment)
+        Section and meta section headers in text start new sections
+        and meta sections, the sections that followed take their place
+        after them.
+        """
+        old = self.metas[meta]
+        new = _parse_meta_sections(text.splitlines(True), _MetaSection())
+        for line in new[0].sections[0].lines:
+            old.sections[section].append(line)
+            if line.startswith("[["):
+                old.invalidate()
+        if len(new) > 1 or len(new[0].sections) > 1:
+            rest = old.sections[section + 1:]
+            old.sections[section + 1:] = new[0].sections[1:]
+            new[0] = old
+            new[-1].sections.extend(rest)
+            self.metas[meta + 1:meta + 1] = new[1:]
+            old.invalidate()
+            self._groups = None
 
-    def uncomment(self, section, name):
-        def _do_uncomment(writer, line):
-            writer.write(re.sub(r"^#\s*", "", line))
+    def _replace(self, meta, section, lineno, text):
+        """Replace line lineno of a section with text."""
+        sec = self.metas[meta].sections[section]
+        if sec.lines[lineno] == text:
+            return False
+        if _plain_line(text):
+            self.changed = True
+            if text.startswith("[[") or sec.lines[lineno].startswith("[["):
+                self.metas[meta].invalidate()
+            sec.replace(lineno, text)
+        else:
+            self._splice(meta, section, lineno, text, drop=1)
+        return True
 
-        self._at_existing_key(section, name, _do_uncomment,
-                              match=r"#\s*%s\s*\=")
+    def _append_text(self, text):
+        last = self.metas[-1]
+        self._splice(len(self.metas) - 1, len(last.sections) - 1, None, text)
 
-    def set(self, section, name, value):
-        def _do_set(writer, line):
-            writer.write("%s = %s\n" % (name, value))
-        if self.has(section, name):
-            self._at_existing_key(section, name, _do_set)
+    def _before_meta(self, meta, text):
+        """Insert text right before the header of metas[meta]."""
+        prev = self.metas[meta - 1]
+        self._splice(meta - 1, len(prev.sections) - 1, None, text)
+
+    def set_local(self, line):
+        """Add line at the end of the localrc meta section.
+
+        Without a localrc section one is added before the first meta
+        section, or the line is added at the end of the file if there
+        are no meta sections either.
+        """
+        text = "%s\n" % line.rstrip()
+        if not self.exists:
+            self.exists = True
+            self._append_text("[[local|localrc]]\n" + text)
+            return True
+        has_local = self.has_local_section()
+        in_local = False
+        for m, meta in enumerate(self.metas):
+            if meta.header is not None:
+                if meta.header.startswith("[[local|localrc]]"):
+                    in_local = True
+                elif in_local:
+                    self._before_meta(m, text)
+                    return True
+                elif not has_local:
+                    self._before_meta(m, "[[local|localrc]]\n" + text)
+                    return True
+            for s, lineno in meta.strays():
+                stray = meta.sections[s].lines[lineno]
+                if stray.startswith("[[local|localrc]]"):
+                    in_local = True
+                elif in_local:
+                    self._splice(m, s, lineno, text)
+                    return True
+                elif not has_local:
+                    self._splice(m, s, lineno, "[[local|localrc]]\n" + text)
+                    return True
+        self._append_text(text)
+        return True
+
+    def set(self, group, conf, section, name, value):
+        """Set name in section of the meta section group|conf.
+
+        The first setting of name in the section is replaced, otherwise
+        the key is added at the end of the section, adding the section
+        and the meta section as needed.
+        """
+        text = "%s = %s\n" % (name, value)
+        if not self.exists:
+            self.exists = True
+            self._append_text(
+                "[[%s|%s]]\n[%s]\n%s" % (group, conf, section, text))
+            return True
+        if not section or "[" in section or "]" in section:
+            return self._set_scan(group, conf, section, name, text)
+        section_header = "[%s]" % section
+        for m, meta in enumerate(self.metas):
+            if meta.matches(group, conf):
+                break
+        else:
+            self._append_text(
+                "[[%s|%s]]\n[%s]\n%s" % (group, conf, section, text))
+            return True
+        # the section the meta section before ends in carries over
+        last = self.metas[m - 1].sections[-1].header
+        in_section = last is not None and last.startswith(section_header)
+        # only the run of matching meta sections starting at m is
+        # looked at, the first one after it ends the search
+        while True:
+            sections = self.metas[m].sections
+            s = 0 if in_section else self.metas[m].first_section(section)
+            while s is not None:
+                in_section = True
+                found = sections[s].find(name)
+                if found is not None:
+                    return self._replace(m, s, found, text)
+                if s + 1 == len(sections):
+                    break
+                if not sections[s + 1].header.startswith(section_header):
+                    self._splice(m, s, None, text)
+                    return True
+                s += 1
+            m += 1
+            if m == len(self.metas):
+                break
+            if not self.metas[m].matches(group, conf):
+                break
+        if not in_section:
+            text = "%s\n%s" % (section_header, text)
+        if m == len(self.metas):
+            self._append_text(text)
         else:
-            self.add(section, name, value)
+            self._before_meta(m, text)
+        return True
+
+    def _set_scan(self, group, conf, section, name, text):
+        """set() for section names the section index cannot answer."""
+        section_header = "[%s]" % section
+        in_meta = False
+        in_section = False
+        for m, meta in enumerate(self.metas):
+            if meta.header is not None:
+                if meta.matches(group, conf):
+                    in_meta = True
+                else:
+                    if in_meta:
+                        if not in_section:
+                            text = "%s\n%s" % (section_header, text)
+                        self._before_meta(m, text)
+                        return True
+                    in_meta = False
+                    in_section = False
+            for s, sec in enumerate(meta.sections):
+                if sec.header is not None:
+                    if sec.header.startswith(section_header):
+                        in_section = True
+                    else:
+                        if in_meta and in_section:
+                            self._splice(m, s - 1, None, text)
+                            return True
+                        in_section = False
+                start = 0
+                for lineno in sec.brackets():
+                    # only section names with brackets in them can
+                    # match a line that is not a section header
+                    if not sec.lines[lineno].startswith(section_header):
+                        continue
+                    if in_meta and in_section:
+                        found = sec.find(name, start, lineno)
+                        if found is not None:
+                            return self._replace(m, s, found, text)
+                    in_section = True
+                    start = lineno + 1
+                if in_meta and in_section:
+                    found = sec.find(name, start)
+                    if found is not None:
+                        return self._replace(m, s, found, text)
+        if not in_meta:
+            text = "[[%s|%s]]\n[%s]\n%s" % (group, conf, section, text)
+        elif not in_section:
+            text = "[%s]\n%s" % (section, text)
+        self._append_text(text)
+        return True
+
+    def merge_operations(self):
+        """Yield the edits merging this document into another one.
+
+        localrc lines become ("set_local", line) and every setting of
+        the other meta sections ("set", group, conf, section, name,
+        value), in the order of the document.
+        """
+        for group, conf in self.groups():
+            if group == "local":
+                for line in self.section(group, conf):
+                    yield ("set_local", line)
+            else:
+                for section, name, value in self.conf(group, conf):
+                    yield ("set", group, conf, section, name, value)
+
+    def apply(self, operations):
+        """Apply edits as made by merge_operations()."""
+        changed = False
+        for op in operations:
+            changed = getattr(self, op[0])(*op[1:]) or changed
+        return changed
+
+    def merge(self, other):
+        """Merge the LocalConfDocument other into this one."""
+        return self.apply(other.merge_operations())
+
+
+def _meta_ranges(data, prefix):
+    """Return the (start, end) byte ranges of some meta sections.
+
+    data is the content of a local.conf as bytes or a memory map, the
+    ranges are those of the meta sections with a header line starting
+    with prefix, headers excluded, just like LocalConf._section().
+    """
+    ranges = []
+    start = None
+    pos = data.find(b"[[")
+    while pos != -1:
+        if pos and data[pos - 1] != ord("\n"):
+            pos = data.find(b"[[", pos + 1)
+            continue
+        eol = data.find(b"\n", pos)
+        end = len(data) if eol == -1 else eol + 1
+        if _META_BYTES_RE.match(data, pos, end):
+            if start is not None and start < pos:
+                ranges.append((start, pos))
+            start = None
+            if data[pos:pos + len(prefix)] == prefix:
+                start = end
+        pos = data.find(b"[[", end)
+    if start is not None and start < len(data):
+        ranges.append((start, len(data)))
+    return ranges
+
+
+def _copy_range(src, dst, data, start, end):
+    """Copy bytes start:end of the file src to the file dst.
+
+    src and dst are file descriptors, dst written at its position.
+    The kernel copies the bytes with os.copy_file_range where it can,
+    otherwise they are written out of data, src mapped in memory, or
+    data itself for a src of None.
+    """
+    copy = src is not None and getattr(os, "copy_file_range", None)
+    while start < end:
+        written = 0
+        if copy:
+            try:
+                written = copy(src, dst, end - start, start)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                   errno.EOPNOTSUPP, errno.EBADF):
+                    raise
+                copy = None
+        if not written:
+            written = os.write(dst, data[start:end])
+        _count("bytes_written", written)
+        start += written
+
+
+@contextlib.contextmanager
+def _mapped(f):
+    """Map the open file f in memory, read only; b"" if it is empty."""
+    if not os.fstat(f.fileno()).st_size:
+        yield b""
+        return
+    import mmap
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        _count("bytes_read", len(data))
+        yield data
+
+
+def _digest(chunks):
+    """Return the sha256 hex digest of an iterable of bytes."""
+    import hashlib
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_digest(fname):
+    with open(fname, "rb") as f:
+        digest = _digest(iter(lambda: f.read(65536), b""))
+        _count("bytes_read", f.tell())
+        return digest
+
+
+class StampFile(object):
+    """Record of what was extracted out of local.conf into which files.
+
+    For every target file the stamp keeps its size, mtime and sha256
+    after the last extraction, and the sha256 of each meta section
+    extracted into it. An extraction can be skipped while its meta
+    section hashes the same and the target was not changed since; a
+    target whose mtime changed but whose content did not still counts
+    as unchanged. The stamp is a JSON file; a missing or unreadable
+    one just means everything is extracted again.
+    """
+
+    def __init__(self, fname, fsync=None):
+        import json
+        self.fname = fname
+        self.fsync = fsync
+        try:
+            with open(fname) as f:
+                self.targets = json.load(f)["targets"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.targets = {}
+
+    def fresh(self, target, header, digest):
+        """Return True if header was extracted into target as it is."""
+        entry = self.targets.get(os.path.realpath(target))
+        if not entry or entry["sections"].get(header) != digest:
+            return False
+        try:
+            st = os.stat(target)
+        except FileNotFoundError:
+            return False
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns != entry["mtime_ns"]:
+            if _file_digest(target) != entry["sha256"]:
+                return False
+            entry["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    def record(self, target, header, digest, changed):
+        """Record that header, hashing digest, went into target.
+
+        If that changed target, whatever else was extracted into it
+        before has to be extracted again.
+        """
+        path = os.path.realpath(target)
+        entry = self.targets.get(path)
+        st = os.stat(target)
+        if (changed or entry is None or st.st_size != entry["size"] or
+                st.st_mtime_ns != entry["mtime_ns"]):
+            sections = {} if changed or entry is None else entry["sections"]
+            entry = self.targets[path] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": _file_digest(target),
+                "sections": sections,
+            }
+        entry["sections"][header] = digest
+
+    def save(self):
+        """Write the stamp, if anything in it changed.
+
+        Nothing is written while planning(), as no extraction was.
+        """
+        if _plan is not None:
+            return False
+        import json
+        with _replace_file(self.fname, self.fsync) as writer:
+            json.dump({"targets": self.targets}, writer, indent=2,
+                      sort_keys=True)
+            writer.write("\n")
+        return writer.changed
+
+
+def _merge_operations(fname):
+    """Return the merge operations of the local.conf fname as a list.
+
+    This is what merge sources are parsed into by worker processes.
+    """
+    return list(LocalConfDocument.load(fname).merge_operations())
 
 
 class LocalConf(object):
-    """Class for manipulating local.conf files in place."""
+    """Class for manipulating local.conf files in place.
+
+    Edits return True if they changed the target file, which is only
+    written when they do.
+    """
 
-    def __init__(self, fname):
+    def __init__(self, fname, fsync=None, symbols=None):
         self.fname = fname
+        self.fsync = fsync
+        self.symbols = SymbolTable() if symbols is None else symbols
+
+    def _document(self, missing_ok=False):
+        """Parse the file into a LocalConfDocument, in a single read."""
+        if missing_ok and not _exists(self.fname):
+            return LocalConfDocument(fname=self.fname)
+        return LocalConfDocument.load(self.fname)
+
+    @contextlib.contextmanager
+    @_generator_operation
+    def batch(self):
+        """Apply many edits with a single read and a single write.
+
+        Yields a LocalConfDocument with the edit methods of LocalConf,
+        the file is written once when the block exits, if anything
+        changed; if the block raises, the file is left untouched.
+        """
+        doc = self._document(missing_ok=True)
+        yield doc
+        if doc.changed:
+            doc.save(self.fname, self.fsync)
 
     def _conf(self, group, conf):
-        current_section = ""
-        for line in self._section(group, conf):
-            m = re.match(r"\[([^\[\]]+)\]", line)
-            if m:
-                current_section = m.group(1)
-                continue
-            else:
-                m2 = re.match(r"(\w+)\s*\=\s*(.+)", line)
-                if m2:
-                    yield current_section, m2.group(1), m2.group(2)
+        return self._document().conf(group, conf)
 
+    @_operation
     def groups(self):
         """Return a list of all groups in the local.conf"""
-        groups = []
-        with open(self.fname) as reader:
-            for line in reader.readlines():
-                m = re.match(r"\[\[([^\[\]]+)\|([^\[\]]+)\]\]", line)
-                if m:
-                    group = (m.group(1), m.group(2))
-                    groups.append(group)
-        return groups
+        return self._document().groups()
 
     def _section(self, group, conf):
         """Yield all the lines out of a meta section."""
-        in_section = False
-        with open(self.fname) as reader:
-            for line in reader.readlines():
-                if re.match(r"\[\[%s\|%s\]\]" % (
-                        re.escape(group),
-                        re.escape(conf)),
-                        line):
-                    in_section = True
-                    continue
-                # any other meta section means we aren't in the
-                # section we want to be.
-                elif re.match(r"\[\[.*\|.*\]\]", line):
-                    in_section = False
-                    continue
-                if in_section:
-                    yield line
+        return self._document().section(group, conf)
 
     def _has_local_section(self):
-        for group in self.groups():
-            if group == ("local", "localrc"):
-                return True
-        return False
+        return self._document().has_local_section()
 
-    def extract(self, group, conf, target):
-        ini_file = IniFile(target)
-        for section, name, value in self._conf(group, conf):
-            ini_file.set(section, name, value)
+    @_operation
+    def extract(self, group, conf, target, stamp=None, force=False):
+        """Set every key of a meta section in the ini file target.
 
-    def extract_localrc(self, target):
-        with open(target, "a+") as f:
-            for line in self._section("local", "localrc"):
-                f.write(line)
+        All keys are applied to the target in memory, which is then
+        written once, if its content changed. With a StampFile stamp,
+        nothing is done if the meta section and target are the same as
+        the stamp recorded, unless force is given.
+        """
+        lc = self._document()
+        if stamp is not None:
+            header = "[[%s|%s]]" % (group, conf)
+            digest = _digest(line.encode() for line in lc.section(group,
+                                                                  conf))
+            if not force and stamp.fresh(target, header, digest):
+                stamp.save()
+                return False
+        doc = IniFile(target, self.fsync)._document(missing_ok=True)
+        for section, name, value in lc.conf(group, conf):
+            doc.set(section, name, value)
+        changed = doc.changed and doc.save(target, self.fsync)
+        if stamp is not None and _plan is None and os.path.exists(target):
+            stamp.record(target, header, digest, changed)
+            stamp.save()
+        return changed
 
-    def _at_insert_point_local(self, name, func):
-        """Run function when we are at the right insertion point in file.
+    @staticmethod
+    def _targets(doc, group, symbols):
+        targets = {}
+        for g, conf in doc.groups():
+            if g == "local" or group is not None and g != group:
+                continue
+            if (g, conf) not in targets:
+                targets[(g, conf)] = symbols.resolve(conf)
+        return targets
 
-        This lets us process an arbitrary file and insert content at
-        the correct point. It has a few different state flags that we
-        are looking for.
+    @_operation
+    def targets(self, group=None, symbols=None):
+        """Return the files the meta sections of local.conf are for.
 
-        Does this file have a local section at all? If not, we need to
-        write one early in the file (this means we work with an empty
-        file, as well as a file that has only post-config sections.
+        The result maps every (group, conf) but the localrc one, or
+        only those of group, to conf resolved with the SymbolTable
+        symbols, by default the one of this LocalConf. Raises KeyError
+        for a variable that is not defined.
+        """
+        symbols = self.symbols if symbols is None else symbols
+        return self._targets(self._document(), group, symbols)
 
-        Are we currently in a local section, if so, we need to write
-        out content to the end, because items added to local always
-        have to be added at the end.
+    @_operation
+    def extract_all(self, group, variables=None, max_workers=None):
+        """Extract every meta section of group into its ini file.
 
-        Did we write out the work that we expected? If so, just blast
-        all lines to the end of the file.
+        The conf of each meta section, like $NOVA_CONF, is resolved as
+        by targets() to find the ini file, variables being a mapping or
+        a SymbolTable; all of them are resolved before anything is
+        written. The files are then written concurrently by up to
+        max_workers threads, each file by a single thread applying its
+        meta sections in the order of the local.conf.
 
+        Returns a dict of the files, in order, to True or False for
+        whether they changed, or to the exception that writing them
+        raised.
         """
-        temp = tempfile.NamedTemporaryFile(mode='r')
-        shutil.copyfile(self.fname, temp.name)
-        in_local = False
-        has_local = self._has_local_section()
-        done = False
-        with open(self.fname, "w+") as writer:
-            with open(temp.name) as reader:
-                for line in reader.readlines():
-                    if done:
-                        writer.write(line)
-                        continue
+        if variables is None:
+            symbols = self.symbols
+        elif isinstance(variables, SymbolTable):
+            symbols = variables
+        else:
+            symbols = SymbolTable(variables)
+        doc = self._document()
+        targets = {}
+        for (g, conf), target in self._targets(doc, group, symbols).items():
+            targets.setdefault(os.path.realpath(target),
+                               (target, []))[1].append(conf)
 
-                    if re.match(re.escape("[[local|localrc]]"), line):
-                        in_local = True
-                    elif in_local and re.match(re.escape("[["), line):
-                        func(writer, None)
-                        done = True
-                        in_local = False
-                    elif not has_local and re.match(re.escape("[["), line):
-                        writer.write("[[local|localrc]]\n")
-                        func(writer, None)
-                        done = True
-                        in_local = False
-                        has_local = True
-
-                    # otherwise, just write what we found
-                    writer.write(line)
-            if not done:
-                func(writer, None)
+        def _extract(target, confs):
+            ini = IniFile(target, self.fsync)._document(missing_ok=True)
+            for conf in confs:
+                for section, name, value in doc.conf(group, conf):
+                    ini.set(section, name, value)
+            return ini.changed and ini.save(target, self.fsync)
 
-    def set_local(self, line):
-        if not os.path.exists(self.fname):
-            with open(self.fname, "w+") as writer:
-                writer.write("[[local|localrc]]\n")
-                writer.write("%s\n" % line.rstrip())
-                return
+        if _profiler is not None:
+            _extract = _profiler.bind(_extract)
+        return _concurrently(
+            {target: functools.partial(_extract, target, confs)
+             for target, confs in targets.values()}, max_workers)
 
-        def _do_set(writer, no_line):
-            writer.write("%s\n" % line.rstrip())
-        self._at_insert_point_local(line, _do_set)
+    @_operation
+    def extract_localrc(self, target, stamp=None, force=False):
+        """Append the localrc meta sections to target.
 
-    def _at_insert_point(self, group, conf, section, name, func):
-        temp = tempfile.NamedTemporaryFile(mode='r')
-        shutil.copyfile(self.fname, temp.name)
-        in_meta = False
-        in_section = False
-        done = False
-        with open(self.fname, "w+") as writer:
-            with open(temp.name) as reader:
-                for line in reader.readlines():
-                    if done:
-                        writer.write(line)
-                        continue
+        local.conf is mapped in memory, and the byte ranges of the
+        sections found in a single scan are copied to target as they
+        are. A StampFile stamp skips this like for extract().
+        """
+        header = "[[local|localrc]]"
+        if _plan is not None:
+            data = "".join(self._section("local", "localrc"))
+            if stamp is not None and not force and stamp.fresh(
+                    target, header, _digest([data.encode()])):
+                return False
+            old = _read_text(target)
+            _plan.record(target, old, (old or "") + data)
+            return old is None or bool(data)
+        changed = not os.path.exists(target)
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            os.lseek(fd, 0, os.SEEK_END)
+            with open(self.fname, "rb") as f, _mapped(f) as data:
+                src = f.fileno()
+                if data.find(b"\r") == -1:
+                    ranges = _meta_ranges(data, header.encode())
+                else:
+                    # reading text turns these into newlines
+                    src = None
+                    data = "".join(self._section("local", "localrc"))
+                    data = data.encode()
+                    ranges = [(0, len(data))] if data else []
+                if stamp is not None:
+                    digest = _digest(data[start:end] for start, end in ranges)
+                    if not force and stamp.fresh(target, header, digest):
+                        stamp.save()
+                        return False
+                for start, end in ranges:
+                    _copy_range(src, fd, data, start, end)
+                    changed = True
+        finally:
+            os.close(fd)
+        if stamp is not None:
+            stamp.record(target, header, digest, changed)
+            stamp.save()
+        return changed
 
-                    if re.match(re.escape("[[%s|%s]]" % (group, conf)), line):
-                        in_meta = True
-                        writer.write(line)
-                    elif re.match(r"\[\[.*\|.*\]\]", line):
-                        # if we're not done yet, we
-                        if in_meta:
-                            if not in_section:
-                                # if we've not found the section yet,
-                                # write out section as well.
-                                writer.write("[%s]\n" % section)
-                            func(writer, None)
-                            done = True
-                        writer.write(line)
-                        in_meta = False
-                        in_section = False
-                    elif re.match(re.escape("[%s]" % section), line):
-                        # we found a relevant section
-                        writer.write(line)
-                        in_section = True
-                    elif re.match(r"\[[^\[\]]+\]", line):
-                        if in_meta and in_section:
-                            # We've ended our section, in our meta,
-                            # never found the key. Time to add it.
-                            func(writer, None)
-                            done = True
-                        in_section = False
-                        writer.write(line)
-                    elif (in_meta and in_section and
-                          re.match(r"\s*%s\s*\=" % re.escape(name), line)):
-                        # we found our match point
-                        func(writer, line)
-                        done = True
-                    else:
-                        # write out whatever we find
-                        writer.write(line)
-            if not done:
-                if not in_meta:
-                    writer.write("[[%s|%s]]\n" % (group, conf))
-                    in_section = False
-                if not in_section:
-                    writer.write("[%s]\n" % (section))
-                func(writer, None)
+    def _edit(self, func, *args):
+        doc = self._document(missing_ok=True)
+        if not func(doc, *args):
+            return False
+        return doc.save(self.fname, self.fsync)
 
+    @_operation
+    def set_local(self, line):
+        return self._edit(LocalConfDocument.set_local, line)
+
+    @_operation
     def set(self, group, conf, section, name, value):
-        if not os.path.exists(self.fname):
-            with open(self.fname, "w+") as writer:
-                writer.write("[[%s|%s]]\n" % (group, conf))
-                writer.write("[%s]\n" % section)
-                writer.write("%s = %s\n" % (name, value))
-                return
+        return self._edit(LocalConfDocument.set, group, conf, section,
+                          name, value)
 
-        def _do_set(writer, line):
-            writer.write("%s = %s\n" % (name, value))
-        self._at_insert_point(group, conf, section, name, _do_set)
+    @_operation
+    def merge_lc(self, *lcfiles, jobs=1):
+        """Merge the local.conf files lcfiles into this one, in order.
 
-    def merge_lc(self, lcfile):
-        lc = LocalConf(lcfile)
-        groups = lc.groups()
-        for group, conf in groups:
-            if group == "local":
-                for line in lc._section(group, conf):
-                    self.set_local(line)
-            else:
-                for section, name, value in lc._conf(group, conf):
-                    self.set(group, conf, section, name, value)
+        With jobs above 1, that many processes parse the files at the
+        same time. The merge is done in memory, in the order of
+        lcfiles, and the file written once, if its content changed.
+        """
+        if jobs > 1 and len(lcfiles) > 1:
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor(
+                    min(jobs, len(lcfiles))) as pool:
+                operations = list(pool.map(_merge_operations, lcfiles))
+        else:
+            operations = [_merge_operations(f) for f in lcfiles]
+        doc = self._document(missing_ok=True)
+        for ops in operations:
+            doc.apply(ops)
+        return doc.changed and doc.save(self.fname, self.fsync)
+
+
+def _set_localrc(doc, name, value):
+    return doc.set_local("%s=%s" % (name, value))
+
+
+# the operations of apply_edits: the kind of file they edit, the
+# function they call with its document and the names of its arguments
+EDIT_OPERATIONS = {
+    "set": (IniFile, IniDocument.set, ("section", "name", "value")),
+    "remove": (IniFile, IniDocument.remove, ("section", "name")),
+    "comment": (IniFile, IniDocument.comment, ("section", "name")),
+    "uncomment": (IniFile, IniDocument.uncomment, ("section", "name")),
+    "setlc": (LocalConf, _set_localrc, ("name", "value")),
+    "setlc_conf": (LocalConf, LocalConfDocument.set,
+                   ("group", "conf", "section", "name", "value")),
+}
+
+
+def _edit_steps(entry):
+    """Return the path, file class and steps of an apply_edits entry."""
+    if not isinstance(entry, dict) or not isinstance(entry.get("path"), str):
+        raise ValueError("every file needs a path")
+    path = entry["path"]
+    operations = entry.get("operations", [])
+    if not isinstance(operations, list):
+        raise ValueError("%s: operations must be a list" % path)
+    cls = None
+    steps = []
+    for n, op in enumerate(operations, 1):
+        where = "%s: operation %d" % (path, n)
+        if not isinstance(op, dict) or op.get("op") not in EDIT_OPERATIONS:
+            raise ValueError("%s: op must be one of %s" % (
+                where, ", ".join(EDIT_OPERATIONS)))
+        op_cls, func, names = EDIT_OPERATIONS[op["op"]]
+        if cls not in (None, op_cls):
+            raise ValueError("%s: %s is not an operation on %s files" % (
+                where, op["op"], "ini" if cls is IniFile else "local.conf"))
+        cls = op_cls
+        unknown = set(op) - set(names) - {"op"}
+        if unknown:
+            raise ValueError("%s: unknown arguments %s" % (
+                where, ", ".join(sorted(unknown))))
+        for name in names:
+            if not isinstance(op.get(name), str):
+                raise ValueError("%s: %s must be a string" % (where, name))
+        steps.append((func, [op[name] for name in names]))
+    return path, cls, steps
+
+
+def apply_edits(files, fsync=None, max_workers=None):
+    """Apply the edits of files, a list of files and their operations.
+
+    Each file is a dict like
+    {"path": "/etc/nova/nova.conf", "operations": [
+        {"op": "set", "section": "DEFAULT", "name": "debug",
+         "value": "True"}]}
+    with operations of EDIT_OPERATIONS, all of them on ini files or all
+    of them on local.conf files. The whole list is checked before
+    anything is written, raising ValueError if it is not valid.
+
+    The operations of a file are applied in order with one read and one
+    write of it, files named more than once having theirs applied in
+    the order of the list. Different files are edited concurrently by
+    up to max_workers threads.
+
+    Returns a dict of the files, in order, to True or False for whether
+    they changed, or to the exception that editing them raised.
+    """
+    if not isinstance(files, list):
+        raise ValueError("the edits must be a list of files")
+    edits = {}
+    for entry in files:
+        path, cls, steps = _edit_steps(entry)
+        if not steps:
+            continue
+        first = edits.setdefault(os.path.realpath(path), (path, cls, []))
+        if first[1] is not cls:
+            raise ValueError("%s: ini and local.conf operations on the "
+                             "same file" % path)
+        first[2].extend(steps)
+
+    def _apply(path, cls, steps):
+        changed = False
+        with cls(path, fsync).batch() as doc:
+            for func, args in steps:
+                changed = func(doc, *args) or changed
+        return changed
+
+    return _concurrently(
+        {path: functools.partial(_apply, path, cls, steps)
+         for path, cls, steps in edits.values()}, max_workers)
+
+
+def _stat_key(fname):
+    try:
+        st = os.stat(fname)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class FileChangedError(Exception):
+    """A file with edits held by a Session was changed by someone else."""
+
+
+class SessionFile(object):
+    """A file of a Session and its parsed document, if any.
+
+    The methods of the document, like set() or get() for ini files and
+    set_local() for local.conf files, can be called on the SessionFile
+    directly; each call takes the lock of the file and checks that the
+    document is still the one on disk. Use edit() for several calls
+    under one lock.
+    """
+
+    def __init__(self, fname, cls, fsync=None):
+        import threading
+        self.fname = fname
+        self.cls = cls
+        self.fsync = fsync
+        self.lock = threading.RLock()
+        self.doc = None
+        self.stat = None
+        self.dirty = False
+
+    def _check(self):
+        """Make sure held edits are not based on an old file.
+
+        If the file changed on disk since it was parsed, the held edits
+        are dropped rather than written over the other change.
+        """
+        if self.dirty and _stat_key(self.fname) != self.stat:
+            self.dirty = False
+            self.invalidate()
+            raise FileChangedError(
+                "%s was changed by another process, deferred edits to it "
+                "were dropped" % self.fname)
+
+    def document(self):
+        """Return the document, reparsing it if the file changed."""
+        self._check()
+        if not self.dirty:
+            key = _stat_key(self.fname)
+            if self.doc is None or key != self.stat:
+                if key is None:
+                    self.doc = self.cls(fname=self.fname)
+                else:
+                    self.doc = self.cls.load(self.fname)
+                self.stat = key
+        return self.doc
+
+    @contextlib.contextmanager
+    def edit(self):
+        """Yield the document to read or edit it under the lock.
+
+        Edits are held until the file is flushed. If the block raises,
+        a document that had no held edits is dropped, so that it is
+        parsed again from the file.
+        """
+        with self.lock:
+            doc = self.document()
+            try:
+                yield doc
+            except Exception:
+                if not self.dirty:
+                    self.invalidate()
+                raise
+            self.dirty = self.dirty or doc.changed
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.cls, name)
+        if not callable(method):
+            raise AttributeError(name)
+
+        def _call(*args, **kwargs):
+            with self.edit() as doc:
+                return method(doc, *args, **kwargs)
+
+        return _call
+
+    def flush(self):
+        """Write the held edits, returning True if the file changed."""
+        with self.lock:
+            self._check()
+            if not self.dirty:
+                return False
+            changed = self.doc.save(self.fname, self.fsync)
+            self.stat = _stat_key(self.fname)
+            self.dirty = False
+            return changed
+
+    def invalidate(self):
+        self.doc = None
+        self.stat = None
+
+
+class Session(object):
+    """Parsed ini and local.conf documents kept between edits.
+
+    ini() and local_conf() return a SessionFile per file, keyed by real
+    path. Before every use it is checked against the inode, mtime and
+    size of the file, so changes by other processes are picked up
+    without reparsing files that did not change. Edits are held in
+    memory until flush(), or the end of the with block:
+
+        with Session() as session:
+            nova = session.ini("/etc/nova/nova.conf")
+            nova.set("DEFAULT", "debug", "True")
+            workers = nova.get("api", "workers")
+
+    If the block raises, the held edits are not written.
+    """
+
+    def __init__(self, fsync=None):
+        import threading
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def _file(self, fname, cls):
+        key = os.path.realpath(fname)
+        with self._lock:
+            if key not in self._files:
+                self._files[key] = SessionFile(key, cls, self.fsync)
+            f = self._files[key]
+        if f.cls is not cls:
+            raise ValueError("%s is already open as a %s" % (
+                fname, f.cls.__name__))
+        return f
+
+    def ini(self, fname):
+        """Return the SessionFile of the ini file fname."""
+        return self._file(fname, IniDocument)
+
+    def local_conf(self, fname):
+        """Return the SessionFile of the local.conf fname."""
+        return self._file(fname, LocalConfDocument)
+
+    @contextlib.contextmanager
+    def external(self, *fnames):
+        """Let something else edit fnames on disk.
+
+        Held edits to them are written first, and their documents are
+        dropped afterwards.
+        """
+        with self._lock:
+            files = sorted(set(self._files.get(os.path.realpath(f))
+                               for f in fnames) - {None},
+                           key=lambda f: f.fname)
+        with contextlib.ExitStack() as stack:
+            for f in files:
+                stack.enter_context(f.lock)
+                f.flush()
+            try:
+                yield
+            finally:
+                for f in files:
+                    f.invalidate()
+
+    def flush(self, max_workers=1):
+        """Write all held edits, by up to max_workers threads.
+
+        Every file is flushed even if some of them fail, the first
+        error is raised at the end. Returns a dict of the files to
+        whether they changed.
+        """
+        with self._lock:
+            files = list(self._files.values())
+        results = _concurrently(
+            {f.fname: f.flush for f in files if f.dirty}, max_workers)
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+
+_profile_from_env()
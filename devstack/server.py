@@ -0,0 +1,248 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Long running dsconf. Starting python and importing dsconf costs far
+# more than a single edit, so a server keeps one process and the
+# parsed ini documents warm, and takes dsconf commands one per line
+# over a unix socket, or over stdin / stdout as a bash coproc.
+
+import contextlib
+import errno
+import os
+import shlex
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+
+import devstack.cmd
+import devstack.dsconf
+
+
+# kept here for the users of the server
+FileChangedError = devstack.dsconf.FileChangedError
+
+
+class DocumentCache(object):
+    """Parsed ini documents kept between commands.
+
+    The documents are those of a dsconf Session, so they are keyed by
+    real path and revalidated against the inode, mtime and size of the
+    file before each use. Each file has its own lock, so commands for
+    the same file are applied one at a time and in order.
+
+    Edits are written at the end of every command, unless defer is set,
+    in which case they are only written by flush().
+    """
+
+    def __init__(self, defer=False):
+        self.defer = defer
+        self.session = devstack.dsconf.Session()
+
+    @contextlib.contextmanager
+    def ini(self, fname):
+        """Yield the IniDocument for fname to edit it."""
+        f = self.session.ini(fname)
+        with f.edit() as doc:
+            yield doc
+        if not self.defer:
+            f.flush()
+
+    def external(self, *fnames):
+        """Let something else edit fnames on disk."""
+        return self.session.external(*fnames)
+
+    def flush(self):
+        """Write all pending edits."""
+        self.session.flush()
+
+
+class Dispatcher(object):
+    """Run dsconf command lines against a DocumentCache.
+
+    Every line gets a one line reply, "ok" or "error: <message>". An
+    edit that changed nothing is answered with "ok unchanged". Besides
+    the dsconf editing commands, "flush" writes any deferred edits.
+    """
+
+    commands = devstack.cmd.INI_COMMANDS + devstack.cmd.LOCALCONF_COMMANDS
+
+    def __init__(self, defer=False):
+        self.cache = DocumentCache(defer)
+        self.parser = devstack.cmd.build_parser(
+            devstack.cmd.OperationParser, self.commands)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._closed = False
+
+    def _run(self, line):
+        """Run line, returning whether it changed anything, if known."""
+        if line.strip() == 'flush':
+            self.cache.flush()
+            return None
+        args = devstack.cmd.parse_operation(line, self.parser, self.commands)
+        if args is None:
+            return None
+        if hasattr(args, 'inifile'):
+            changed = False
+            for fname in devstack.cmd.ini_files(args.inifile):
+                with self.cache.ini(fname) as doc:
+                    changed = args.func(doc, args) or changed
+            return changed
+        fnames = [args.local_conf]
+        if hasattr(args, 'local_rc'):
+            fnames.append(args.local_rc)
+        with self.cache.external(*fnames):
+            return args.func(devstack.dsconf.LocalConf(args.local_conf), args)
+
+    def handle(self, line):
+        """Run one command line and return the reply."""
+        with self._cond:
+            if self._closed:
+                return "error: shutting down"
+            self._active += 1
+        try:
+            changed = self._run(line)
+        except Exception as e:
+            return "error: %s" % str(e).replace("\n", " ")
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+        return "ok unchanged" if changed is False else "ok"
+
+    def close(self):
+        """Refuse new commands, wait for running ones and flush."""
+        with self._cond:
+            self._closed = True
+            while self._active:
+                self._cond.wait()
+        try:
+            self.cache.flush()
+        except Exception as e:
+            print("dsconf: %s" % e, file=sys.stderr)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                line = raw.decode('utf-8')
+            except UnicodeDecodeError as e:
+                self.wfile.write(("error: %s\n" % e).encode('utf-8'))
+                continue
+            if line.strip() == 'shutdown':
+                self.wfile.write(b"ok\n")
+                self.server.stop()
+                return
+            reply = self.server.dispatcher.handle(line)
+            self.wfile.write(("%s\n" % reply).encode('utf-8'))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """dsconf server listening on a unix socket.
+
+    Each connection may send any number of command lines. The
+    "shutdown" command stops the server once running commands are
+    done and pending edits are written.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, defer=False):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(path)
+                except ConnectionRefusedError:
+                    # left behind by a server that is gone
+                    os.unlink(path)
+                else:
+                    raise OSError(errno.EADDRINUSE,
+                                  "a dsconf server is already listening",
+                                  path)
+        self.path = path
+        self.dispatcher = Dispatcher(defer)
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        os.chmod(path, 0o600)
+        self._inode = os.stat(path).st_ino
+
+    def stop(self):
+        """Stop serve_forever(), safe to call from any thread."""
+        threading.Thread(target=self.shutdown).start()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.dispatcher.close()
+        # only remove the socket if it is still ours
+        try:
+            ours = os.stat(self.path).st_ino == self._inode
+        except FileNotFoundError:
+            ours = False
+        if ours:
+            os.unlink(self.path)
+
+
+def serve(path, defer=False):
+    server = Server(path, defer)
+
+    def _stop(signum, frame):
+        server.stop()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve_stream(reader, writer, defer=False):
+    """Run command lines from reader, writing a reply line for each.
+
+    This is the protocol of a bash coproc: the dispatcher runs until
+    reader is closed or sends "exit", then pending edits are written.
+    """
+    dispatcher = Dispatcher(defer)
+    try:
+        for line in iter(reader.readline, ''):
+            if line.strip() == 'exit':
+                writer.write("ok\n")
+                break
+            writer.write("%s\n" % dispatcher.handle(line))
+            writer.flush()
+    finally:
+        dispatcher.close()
+        writer.flush()
+
+
+def client(path, tokens, exit_code=False):
+    """Send one command to a server, returning an exit status.
+
+    With exit_code, an edit that changed nothing returns
+    devstack.cmd.EXIT_UNCHANGED.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(("%s\n" % shlex.join(tokens)).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('r', encoding='utf-8') as reader:
+            reply = reader.readline().strip()
+    if reply == "ok unchanged" and exit_code:
+        return devstack.cmd.EXIT_UNCHANGED
+    if reply == "ok" or reply.startswith("ok "):
+        return 0
+    print("dsconf: %s" % reply, file=sys.stderr)
+    return 1
@@ -0,0 +1,261 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Benchmarks for dsconf operations on synthetic ini and local.conf
+# files of growing size.
+#
+#   tox -e bench -- --sections 10,100,1000
+#
+# For every operation and size this prints the operations per second
+# and the bytes read and written per operation, followed by how the
+# time per operation grows with the size of the file: an exponent of
+# about 1 is linear, anything clearly above it is super-linear.
+
+import argparse
+import json
+import math
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+from devstack import dsconf
+
+
+def _key_lines(prefix, keys, comments):
+    """Yield keys settings, a commented out option every 1/comments."""
+    every = int(round(1 / comments)) if comments else 0
+    for k in range(keys):
+        if every and k % every == 0:
+            yield "# %sopt%d = default value\n" % (prefix, k)
+        yield "%skey%d = value %d\n" % (prefix, k, k)
+
+
+def generate_ini(path, sections, keys, comments=0.0):
+    """Write an ini file of sections sections with keys keys each.
+
+    comments is the share of keys that have a commented out option
+    next to them.
+    """
+    with open(path, "w") as f:
+        f.write("# generated by devstack.tests.benchmark\n")
+        for s in range(sections):
+            f.write("[section%d]\n" % s)
+            f.writelines(_key_lines("", keys, comments))
+
+
+def generate_local_conf(path, sections, keys, comments=0.0, groups=4,
+                        localrc=None, prefix=""):
+    """Write a local.conf with a localrc and groups post-config blocks.
+
+    The sections are spread over the post-config blocks, and localrc
+    gets localrc lines, by default keys of them.
+    """
+    if localrc is None:
+        localrc = keys
+    with open(path, "w") as f:
+        f.write("[[local|localrc]]\n")
+        for k in range(localrc):
+            f.write("%sVAR%d=value%d\n" % (prefix.upper(), k, k))
+        for g in range(groups):
+            f.write("[[post-config|$CONF%d]]\n" % g)
+            for s in range(g, sections, groups):
+                f.write("[section%d]\n" % s)
+                f.writelines(_key_lines(prefix, keys, comments))
+
+
+def _io_counters():
+    """Return (rchar, wchar) of this process, or None if unknown."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f)
+    except OSError:
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+class Benchmark(object):
+    """Time one operation against fresh copies of generated files.
+
+    setup(workdir) generates the pristine files once per size and
+    returns a dict of names to paths, the first one being the file
+    that is operated on; op(paths, i) is the timed operation. The files
+    are restored from the pristine copies before every run, outside of
+    the timed part.
+    """
+
+    def __init__(self, name, setup, op):
+        self.name = name
+        self.setup = setup
+        self.op = op
+
+    def run(self, workdir, repeat):
+        pristine = self.setup(workdir)
+        size = os.path.getsize(next(iter(pristine.values())))
+        paths = {}
+        for name, path in pristine.items():
+            paths[name] = path + ".work"
+        elapsed = 0.0
+        read = written = 0
+        for i in range(repeat):
+            for name, path in pristine.items():
+                if os.path.exists(path):
+                    shutil.copyfile(path, paths[name])
+                elif os.path.exists(paths[name]):
+                    os.unlink(paths[name])
+            before = _io_counters()
+            start = time.perf_counter()
+            self.op(paths, i)
+            elapsed += time.perf_counter() - start
+            after = _io_counters()
+            if before and after:
+                read += after[0] - before[0]
+                written += after[1] - before[1]
+        return {
+            "bytes": size,
+            "ops_per_sec": repeat / elapsed if elapsed else float("inf"),
+            "sec_per_op": elapsed / repeat,
+            "read_per_op": read // repeat,
+            "written_per_op": written // repeat,
+        }
+
+
+def benchmarks(sections, keys, comments):
+    """Return the benchmarks for files of the given shape."""
+    middle = "section%d" % (sections // 2)
+
+    def ini(workdir):
+        path = os.path.join(workdir, "bench.ini")
+        generate_ini(path, sections, keys, comments)
+        return {"ini": path}
+
+    def local_conf(workdir):
+        path = os.path.join(workdir, "local.conf")
+        generate_local_conf(path, sections, keys, comments)
+        return {"lc": path, "target": os.path.join(workdir, "target")}
+
+    def merge(workdir):
+        paths = local_conf(workdir)
+        source = os.path.join(workdir, "source.conf")
+        # a tenth of the target, half of it new keys
+        generate_local_conf(source, max(1, sections // 10), keys, comments,
+                            localrc=max(1, keys // 10), prefix="n")
+        paths["source"] = source
+        return paths
+
+    def extract(paths, i):
+        dsconf.LocalConf(paths["lc"]).extract(
+            "post-config", "$CONF0", paths["target"])
+
+    return [
+        Benchmark("set", ini, lambda p, i: dsconf.IniFile(p["ini"]).set(
+            middle, "key%d" % (keys // 2), "new %d" % i)),
+        Benchmark("set-new", ini, lambda p, i: dsconf.IniFile(p["ini"]).set(
+            middle, "newkey", "new %d" % i)),
+        Benchmark("remove", ini, lambda p, i: dsconf.IniFile(
+            p["ini"]).remove(middle, "key%d" % (keys // 2))),
+        Benchmark("comment", ini, lambda p, i: dsconf.IniFile(
+            p["ini"]).comment(middle, "key%d" % (keys // 2))),
+        Benchmark("uncomment", ini, lambda p, i: dsconf.IniFile(
+            p["ini"]).uncomment(middle, "opt0")),
+        Benchmark("extract", local_conf, extract),
+        Benchmark("extract_localrc", local_conf, lambda p, i: dsconf.LocalConf(
+            p["lc"]).extract_localrc(p["target"])),
+        Benchmark("set_local", local_conf, lambda p, i: dsconf.LocalConf(
+            p["lc"]).set_local("NEW=%d" % i)),
+        Benchmark("merge_lc", merge, lambda p, i: dsconf.LocalConf(
+            p["lc"]).merge_lc(p["source"])),
+    ]
+
+
+def run(sweep, keys=20, comments=0.25, repeat=5, only=None):
+    """Run the benchmarks for every number of sections in sweep.
+
+    Returns a list of result dicts, one per operation and size.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for sections in sweep:
+            for bench in benchmarks(sections, keys, comments):
+                if only and bench.name not in only:
+                    continue
+                result = bench.run(workdir, repeat)
+                result.update(op=bench.name, sections=sections, keys=keys,
+                              comments=comments)
+                results.append(result)
+    return results
+
+
+def scaling(results):
+    """Return {op: exponent} of time per op against file size.
+
+    The exponent is fitted between the smallest and the largest size;
+    1.0 means the operation is linear in the size of the file.
+    """
+    by_op = {}
+    for r in results:
+        by_op.setdefault(r["op"], []).append(r)
+    exponents = {}
+    for op, rs in by_op.items():
+        first, last = rs[0], rs[-1]
+        if last["bytes"] > first["bytes"] and first["sec_per_op"] > 0:
+            exponents[op] = (
+                math.log(last["sec_per_op"] / first["sec_per_op"]) /
+                math.log(last["bytes"] / first["bytes"]))
+    return exponents
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m devstack.tests.benchmark",
+        description="benchmark dsconf operations on synthetic files")
+    parser.add_argument(
+        "--sections", default="10,100,300",
+        help="comma separated number of sections to sweep over")
+    parser.add_argument("--keys", type=int, default=20,
+                        help="keys per section")
+    parser.add_argument("--comments", type=float, default=0.25,
+                        help="share of keys with a commented out option")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of every operation per size")
+    parser.add_argument("--op", action="append", dest="only",
+                        help="only run this operation, may be repeated")
+    parser.add_argument("--json", action="store_true",
+                        help="print one JSON object per result")
+    args = parser.parse_args(argv)
+
+    sweep = [int(s) for s in args.sections.split(",")]
+    results = run(sweep, args.keys, args.comments, args.repeat, args.only)
+    if args.json:
+        for r in results:
+            print(json.dumps(r, sort_keys=True))
+        return 0
+    print("%-16s %9s %11s %11s %12s %12s" % (
+        "operation", "sections", "bytes", "ops/sec", "read/op",
+        "written/op"))
+    for r in results:
+        print("%-16s %9d %11d %11.1f %12d %12d" % (
+            r["op"], r["sections"], r["bytes"], r["ops_per_sec"],
+            r["read_per_op"], r["written_per_op"]))
+    exponents = scaling(results)
+    if exponents:
+        print()
+        print("time per op ~ size ** n")
+        for op, n in exponents.items():
+            print("%-16s n = %.2f" % (op, n))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import builtins
+import json
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+NOVA = """[DEFAULT]
+debug = False
+verbose = True
+# use_syslog = True
+"""
+
+NOVA_RESULT = """[DEFAULT]
+debug = True
+# verbose = True
+use_syslog = True
+[api]
+workers = 4
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+ADMIN_PASSWORD=secret
+"""
+
+LOCAL_CONF_RESULT = """[[local|localrc]]
+ADMIN_PASSWORD=secret
+LOGFILE=/tmp/stack.log
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+"""
+
+YAML = """
+- path: {path}
+  operations:
+  - op: remove
+    section: DEFAULT
+    name: debug
+"""
+
+
+class TestApply(testtools.TestCase):
+
+    def setUp(self):
+        super(TestApply, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self.nova = self._write("nova.conf", NOVA)
+        self.lc = self._write("local.conf", LOCAL_CONF)
+        self.edits = [
+            {"path": self.nova, "operations": [
+                {"op": "set", "section": "DEFAULT", "name": "debug",
+                 "value": "True"},
+                {"op": "comment", "section": "DEFAULT", "name": "verbose"},
+                {"op": "uncomment", "section": "DEFAULT",
+                 "name": "use_syslog"},
+            ]},
+            {"path": self.lc, "operations": [
+                {"op": "setlc", "name": "LOGFILE", "value": "/tmp/stack.log"},
+                {"op": "setlc_conf", "group": "post-config",
+                 "conf": "$NOVA_CONF", "section": "DEFAULT", "name": "debug",
+                 "value": "True"},
+            ]},
+            {"path": os.path.join(self._dir, ".", "nova.conf"),
+             "operations": [
+                 {"op": "set", "section": "api", "name": "workers",
+                  "value": "4"},
+            ]},
+        ]
+        self.stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout",
+                                             self.stdout.stream))
+        self.stderr = self.useFixture(fixtures.StringStream("stderr"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stderr",
+                                             self.stderr.stream))
+
+    def _write(self, name, content):
+        path = os.path.join(self._dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def _output(self, name):
+        fixture = getattr(self, name)
+        fixture.stream.flush()
+        return fixture.getDetails()[name].as_text()
+
+    def test_apply_edits(self):
+        results = dsconf.apply_edits(self.edits, max_workers=2)
+        self.assertEqual({self.nova: True, self.lc: True}, results)
+        self.assertEqual(NOVA_RESULT, self._read(self.nova))
+        self.assertEqual(LOCAL_CONF_RESULT, self._read(self.lc))
+        results = dsconf.apply_edits(self.edits)
+        # like dsconf setlc, setlc always appends to localrc
+        self.assertEqual({self.nova: False, self.lc: True}, results)
+
+    def test_one_read_and_write(self):
+        opened = []
+        real_open = builtins.open
+
+        def _open(fname, *args, **kwargs):
+            opened.append(fname)
+            return real_open(fname, *args, **kwargs)
+
+        self.useFixture(fixtures.MonkeyPatch("builtins.open", _open))
+        dsconf.apply_edits(self.edits)
+        # one read to parse, one to compare with the new content
+        self.assertEqual(2, opened.count(self.nova))
+        self.assertEqual(2, opened.count(self.lc))
+
+    def test_invalid(self):
+        for files, message in (
+                ({"path": self.nova}, "must be a list of files"),
+                ([{"operations": []}], "every file needs a path"),
+                ([{"path": self.nova, "operations": [{"op": "frob"}]}],
+                 "operation 1: op must be one of"),
+                ([{"path": self.nova, "operations": [
+                    {"op": "remove", "section": "DEFAULT"}]}],
+                 "name must be a string"),
+                ([{"path": self.nova, "operations": [
+                    {"op": "remove", "section": "DEFAULT", "name": "a",
+                     "value": "b"}]}],
+                 "unknown arguments value"),
+                ([{"path": self.nova, "operations": [
+                    {"op": "remove", "section": "DEFAULT", "name": "a"},
+                    {"op": "setlc", "name": "A", "value": "1"}]}],
+                 "setlc is not an operation on ini files"),
+                (self.edits + [{"path": self.lc, "operations": [
+                    {"op": "remove", "section": "DEFAULT", "name": "a"}]}],
+                 "ini and local.conf operations on the same file")):
+            e = self.assertRaises(ValueError, dsconf.apply_edits, files)
+            self.assertIn(message, str(e))
+        # nothing was written
+        self.assertEqual(NOVA, self._read(self.nova))
+
+    def test_failed_file(self):
+        missing = os.path.join(self._dir, "missing", "x.conf")
+        results = dsconf.apply_edits([
+            {"path": missing, "operations": [
+                {"op": "set", "section": "a", "name": "b", "value": "c"}]},
+        ] + self.edits)
+        self.assertIsInstance(results[missing], OSError)
+        self.assertTrue(results[self.nova])
+
+    def test_cli(self):
+        edits = self._write("edits.json", json.dumps(self.edits))
+        self.assertEqual(0, cmd.main(["dsconf", "apply", edits]))
+        self.assertEqual(NOVA_RESULT, self._read(self.nova))
+        self.assertEqual(LOCAL_CONF_RESULT, self._read(self.lc))
+        edits = self._write("edits.json", json.dumps(self.edits[:1]))
+        argv = ["dsconf", "--exit-code", "apply", edits, "--jobs", "2"]
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv))
+        self.assertEqual(
+            ["changed %s" % self.nova, "changed %s" % self.lc,
+             "unchanged %s" % self.nova],
+            self._output("stdout").splitlines())
+
+    def test_cli_yaml(self):
+        try:
+            import yaml  # noqa
+        except ImportError:
+            self.skipTest("PyYAML is not installed")
+        edits = self._write("edits.yaml", YAML.format(path=self.nova))
+        self.assertEqual(0, cmd.main(["dsconf", "apply", edits]))
+        self.assertNotIn("debug", self._read(self.nova))
+
+    def test_cli_plan(self):
+        edits = self._write("edits.json", json.dumps(self.edits))
+        self.assertEqual(0, cmd.main(["dsconf", "apply", edits, "--plan"]))
+        self.assertIn("+debug = True", self._output("stdout"))
+        self.assertEqual(NOVA, self._read(self.nova))
+
+    def test_cli_invalid(self):
+        edits = self._write("edits.json", "[{")
+        self.assertEqual(1, cmd.main(["dsconf", "apply", edits]))
+        self.assertIn("dsconf: Expecting", self._output("stderr"))
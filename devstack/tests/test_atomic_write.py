@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+import stat
+import threading
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+BASIC = """
+[default]
+a = b
+"""
+
+
+class TestAtomicWrite(testtools.TestCase):
+
+    def setUp(self):
+        super(TestAtomicWrite, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+        self.fsyncs = []
+        real_fsync = os.fsync
+
+        def _fsync(fd):
+            self.fsyncs.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+            real_fsync(fd)
+
+        self.useFixture(fixtures.MonkeyPatch("os.fsync", _fsync))
+
+    def test_fsync_none(self):
+        dsconf.IniFile(self._path, "none").set("default", "a", "c")
+        self.assertEqual([], self.fsyncs)
+
+    def test_fsync_file(self):
+        dsconf.IniFile(self._path, "file").set("default", "a", "c")
+        self.assertEqual([False], self.fsyncs)
+
+    def test_fsync_file_and_dir(self):
+        dsconf.IniFile(self._path, "file+dir").set("default", "a", "c")
+        self.assertEqual([False, True], self.fsyncs)
+
+    def test_fsync_default(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf.FSYNC_POLICY", "file+dir"))
+        dsconf.IniFile(self._path).set("default", "a", "c")
+        self.assertEqual([False, True], self.fsyncs)
+
+    def test_fsync_batch(self):
+        with dsconf.IniFile(self._path, "file").batch() as doc:
+            doc.set("default", "a", "c")
+            doc.set("default", "d", "e")
+        self.assertEqual([False], self.fsyncs)
+
+    def test_fsync_localconf(self):
+        lc = os.path.join(self._dir, "local.conf")
+        with open(lc, "w") as f:
+            f.write("[[local|localrc]]\nA=1\n")
+        dsconf.LocalConf(lc, "file+dir").set_local("B=2")
+        self.assertEqual([False, True], self.fsyncs)
+
+    def test_fsync_cli(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf.FSYNC_POLICY", "none"))
+        cmd.main(["dsconf", "--fsync", "file", "iniset", self._path,
+                  "default", "a", "c"])
+        self.assertEqual([False], self.fsyncs)
+
+    def test_bad_policy(self):
+        conf = dsconf.IniFile(self._path, "always")
+        self.assertRaises(ValueError, conf.set, "default", "a", "c")
+        with open(self._path) as f:
+            self.assertEqual(BASIC, f.read())
+        self.assertEqual(["test.ini"], os.listdir(self._dir))
+
+    def test_new_file_mode(self):
+        umask = os.umask(0o027)
+        self.addCleanup(os.umask, umask)
+        path = os.path.join(self._dir, "new.ini")
+        dsconf.IniFile(path).set("default", "a", "b")
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_keeps_mode(self):
+        os.chmod(self._path, 0o604)
+        dsconf.IniFile(self._path).set("default", "a", "c")
+        self.assertEqual(0o604, stat.S_IMODE(os.stat(self._path).st_mode))
+
+    def test_no_temp_left_on_error(self):
+        conf = dsconf.IniFile(self._path)
+        try:
+            with conf.batch() as doc:
+                doc.set("default", "a", "c")
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        with dsconf._replace_file(self._path) as writer:
+            writer.write("new\n")
+        self.assertEqual(["test.ini"], os.listdir(self._dir))
+
+    def test_old_handle_keeps_content(self):
+        with open(self._path) as old:
+            ino = os.fstat(old.fileno()).st_ino
+            dsconf.IniFile(self._path).set("default", "a", "c")
+            self.assertNotEqual(ino, os.stat(self._path).st_ino)
+            self.assertEqual(BASIC, old.read())
+
+    def test_reader_never_sees_empty_file(self):
+        conf = dsconf.IniFile(self._path)
+        done = threading.Event()
+        seen = []
+
+        def _read():
+            while not done.is_set():
+                with open(self._path) as f:
+                    seen.append(f.read())
+
+        reader = threading.Thread(target=_read)
+        reader.start()
+        try:
+            for i in range(300):
+                conf.set("default", "a", str(i))
+        finally:
+            done.set()
+            reader.join()
+        self.assertNotEqual([], seen)
+        for content in seen:
+            self.assertIn("[default]\na = ", content)
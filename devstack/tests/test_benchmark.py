@@ -0,0 +1,63 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import dsconf
+from devstack.tests import benchmark
+
+
+class TestBenchmark(testtools.TestCase):
+
+    def test_generate_ini(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(tmp, "test.ini")
+        benchmark.generate_ini(path, 3, 4, comments=0.5)
+        conf = dsconf.IniFile(path)
+        self.assertTrue(conf.has("section2", "key3"))
+        self.assertFalse(conf.has("section3", "key0"))
+        with open(path) as f:
+            self.assertEqual(2 * 3, f.read().count("# opt"))
+
+    def test_generate_local_conf(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(tmp, "local.conf")
+        benchmark.generate_local_conf(path, 8, 2, groups=4)
+        lc = dsconf.LocalConf(path)
+        self.assertEqual(5, len(lc.groups()))
+        self.assertEqual(
+            [("section0", "key0", "value 0"), ("section0", "key1", "value 1"),
+             ("section4", "key0", "value 0"), ("section4", "key1", "value 1")],
+            list(lc._conf("post-config", "$CONF0")))
+
+    def test_run(self):
+        results = benchmark.run([2, 4], keys=2, repeat=1)
+        ops = set(r["op"] for r in results)
+        self.assertEqual(set(["set", "set-new", "remove", "comment",
+                              "uncomment", "extract", "extract_localrc",
+                              "set_local", "merge_lc"]), ops)
+        self.assertEqual(2 * len(ops), len(results))
+        for r in results:
+            self.assertGreater(r["ops_per_sec"], 0)
+        self.assertEqual(ops, set(benchmark.scaling(results)))
+
+    def test_main(self):
+        stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout", stdout.stream))
+        self.assertEqual(0, benchmark.main(
+            ["--sections", "2", "--keys", "2", "--repeat", "1",
+             "--op", "set", "--json"]))
+        stdout.stream.flush()
+        self.assertIn('"op": "set"', stdout.getDetails()["stdout"].as_text())
@@ -0,0 +1,119 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+import sys
+
+import fixtures
+import testtools
+
+from devstack import cmd
+
+
+# modules that only some commands need, and that must not be imported
+# to run the simple ones; shutil is not among them as argparse uses it
+LAZY_MODULES = ('concurrent.futures', 'difflib', 'hashlib', 'inspect',
+                'json', 'mmap', 'pbr', 'shlex', 'tempfile',
+                'importlib.metadata')
+
+# generous, starting dsconf took about 120ms when it imported all of
+# them and 10ms after
+BUDGET_US = 100000
+
+SCRIPT = """
+import devstack.cmd
+devstack.cmd.parse_args(['dsconf', 'iniset', 'x.ini', 'a', 'b', 'c'])
+"""
+
+
+class TestImportTime(testtools.TestCase):
+
+    def _importtime(self):
+        """Return {module: cumulative microseconds} of running SCRIPT."""
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env['PYTHONPYCACHEPREFIX'] = self.useFixture(
+            fixtures.TempDir()).path
+        argv = [sys.executable, '-X', 'importtime', '-c', SCRIPT]
+        # the first run only fills the bytecode cache
+        subprocess.run(argv, env=env, check=True, capture_output=True)
+        proc = subprocess.run(argv, env=env, check=True,
+                              capture_output=True, text=True)
+        times = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = int(cumulative)
+        return times
+
+    def test_lazy_imports(self):
+        times = self._importtime()
+        self.assertIn('devstack.cmd', times)
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, times)
+        self.assertLess(times['devstack.cmd'], BUDGET_US)
+
+
+class TestParseArgs(testtools.TestCase):
+
+    def setUp(self):
+        super(TestParseArgs, self).setUp()
+        self.built = []
+        build_parser = cmd.build_parser
+
+        def _build_parser(parser_class=cmd.argparse.ArgumentParser,
+                          commands=None):
+            self.built.append(commands)
+            return build_parser(parser_class, commands)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'devstack.cmd.build_parser', _build_parser))
+
+    def test_command(self):
+        self.assertEqual('iniset', cmd._command(['iniset', 'a']))
+        self.assertEqual('inirm', cmd._command(
+            ['--fsync', 'file', '--exit-code', 'inirm']))
+        self.assertEqual('setlc', cmd._command(['--fsync=file', 'setlc']))
+        self.assertEqual('iniset', cmd._command(
+            ['--profile-log', 'iniset', 'iniset']))
+
+    def test_command_needs_full_parser(self):
+        for args in ([], ['--help', 'iniset'], ['-h'], ['bogus'],
+                     ['--fs', 'file', 'iniset'], ['--', 'iniset']):
+            self.assertIsNone(cmd._command(args), args)
+
+    def test_only_command_built(self):
+        args, parser = cmd.parse_args(
+            ['dsconf', '--exit-code', 'iniset', 'f', 's', 'n', 'v'])
+        self.assertEqual([('iniset',)], self.built)
+        self.assertEqual(cmd.iniset, args.func)
+        self.assertTrue(args.exit_code)
+        self.assertIsNone(args.plan)
+
+    def test_full_help(self):
+        stdout = self.useFixture(fixtures.StringStream('stdout'))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', stdout.stream))
+        self.assertRaises(SystemExit, cmd.parse_args, ['dsconf', '--help'])
+        self.assertEqual([None], self.built)
+        stdout.stream.flush()
+        text = stdout.getDetails()['stdout'].as_text()
+        for name in cmd.COMMANDS:
+            self.assertIn(name, text)
+
+    def test_unknown_command(self):
+        stderr = self.useFixture(fixtures.StringStream('stderr'))
+        self.useFixture(fixtures.MonkeyPatch('sys.stderr', stderr.stream))
+        self.assertRaises(SystemExit, cmd.parse_args, ['dsconf', 'bogus'])
+        stderr.stream.flush()
+        self.assertIn("'merge_lc'", stderr.getDetails()['stderr'].as_text())
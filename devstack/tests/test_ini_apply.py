@@ -0,0 +1,102 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+
+
+BASIC = """[default]
+a = b
+c = d
+[second]
+e = f
+"""
+
+RESULT = """[default]
+a = new value
+# c = d
+[second]
+[third]
+g = h
+"""
+
+NEW = """[DEFAULT]
+debug = True
+"""
+
+
+class TestIniApply(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniApply, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        self._new = os.path.join(self._dir, "new.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+
+    def _apply(self, lines):
+        ops = os.path.join(self._dir, "ops")
+        with open(ops, "w") as f:
+            f.write("\n".join(lines))
+        return cmd.main(["dsconf", "ini-apply", ops])
+
+    def test_apply(self):
+        ret = self._apply([
+            "# comment",
+            "iniset %s default a 'new value'" % self._path,
+            "iniset %s DEFAULT debug True" % self._new,
+            "",
+            json.dumps(["inicomment", self._path, "default", "c"]),
+            "inirm %s second e" % self._path,
+            "iniset %s third g h" % self._path,
+        ])
+        self.assertEqual(0, ret)
+        with open(self._path) as f:
+            self.assertEqual(RESULT, f.read())
+        with open(self._new) as f:
+            self.assertEqual(NEW, f.read())
+
+    def test_apply_bad_line(self):
+        ret = self._apply([
+            "iniset %s default a 1" % self._path,
+            "setlc %s a 1" % self._path,
+        ])
+        self.assertEqual(1, ret)
+        with open(self._path) as f:
+            self.assertEqual(BASIC, f.read())
+
+    def test_apply_missing_argument(self):
+        ret = self._apply(["iniset %s default a" % self._path])
+        self.assertEqual(1, ret)
+
+    def test_apply_help(self):
+        ret = self._apply([
+            "iniset %s default a 1" % self._path,
+            "inirm --help",
+        ])
+        self.assertEqual(1, ret)
+        with open(self._path) as f:
+            self.assertEqual(BASIC, f.read())
+
+    def test_apply_json_not_strings(self):
+        ret = self._apply([
+            json.dumps(["iniset", self._path, "default", "a", 5]),
+        ])
+        self.assertEqual(1, ret)
+        ret = self._apply([json.dumps({"iniset": self._path})])
+        self.assertEqual(1, ret)
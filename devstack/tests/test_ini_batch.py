@@ -0,0 +1,101 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import dsconf
+
+
+BASIC = """[default]
+a = b
+c = d
+# x = y
+[second]
+e = f
+g = h
+"""
+
+OPS = [
+    ("set", "default", "a", "1"),
+    ("set", "second", "n", "2"),
+    ("remove", "default", "c"),
+    ("uncomment", "default", "x"),
+    ("comment", "second", "e"),
+    ("add", "third", "t", "3"),
+    ("set", "third", "t", "4"),
+]
+
+
+class TestIniBatch(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniBatch, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+
+    def _sequential(self):
+        path = os.path.join(self._dir, "sequential.ini")
+        with open(path, "w") as f:
+            f.write(BASIC)
+        conf = dsconf.IniFile(path)
+        for op in OPS:
+            getattr(conf, op[0])(*op[1:])
+        with open(path) as f:
+            return f.read()
+
+    def test_batch_matches_sequential(self):
+        with dsconf.IniFile(self._path).batch() as b:
+            for op in OPS:
+                getattr(b, op[0])(*op[1:])
+        with open(self._path) as f:
+            self.assertEqual(self._sequential(), f.read())
+
+    def test_batch_writes_on_exit(self):
+        with dsconf.IniFile(self._path).batch() as b:
+            b.set("default", "a", "1")
+            with open(self._path) as f:
+                self.assertEqual(BASIC, f.read())
+        with open(self._path) as f:
+            self.assertIn("a = 1\n", f.read())
+
+    def test_batch_error_leaves_file(self):
+        def _fail():
+            with dsconf.IniFile(self._path).batch() as b:
+                b.set("default", "a", "1")
+                raise ValueError()
+        self.assertRaises(ValueError, _fail)
+        with open(self._path) as f:
+            self.assertEqual(BASIC, f.read())
+
+    def test_batch_new_file(self):
+        path = os.path.join(self._dir, "new.ini")
+        with dsconf.IniFile(path).batch() as b:
+            b.set("default", "a", "b")
+            b.remove("default", "a")
+        with open(path) as f:
+            self.assertEqual("[default]\n", f.read())
+
+    def test_batch_missing_file(self):
+        path = os.path.join(self._dir, "missing.ini")
+
+        def _remove():
+            with dsconf.IniFile(path).batch() as b:
+                b.remove("default", "a")
+        self.assertRaises(FileNotFoundError, _remove)
+        with dsconf.IniFile(path).batch():
+            pass
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,87 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from devstack import dsconf
+
+
+BASIC = """# a comment before any section
+[default]
+a = b
+# c = d
+[second]
+e = f
+[default]
+g = h
+"""
+
+RESULT_ADD = """# a comment before any section
+[default]
+x = 1
+a = b
+# c = d
+[second]
+e = f
+[default]
+x = 1
+g = h
+"""
+
+RESULT_EDIT = """# a comment before any section
+[default]
+a = b
+c = d
+[second]
+[default]
+# g = h
+[new]
+n = 2
+"""
+
+
+class TestIniDocument(testtools.TestCase):
+
+    def test_round_trip(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        self.assertEqual(BASIC, "".join(doc.lines()))
+
+    def test_sections(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        self.assertEqual(["", "default", "second", "default"],
+                         [s.name for s in doc.sections])
+
+    def test_has(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        self.assertTrue(doc.has("default", "a"))
+        self.assertTrue(doc.has("default", "g"))
+        self.assertTrue(doc.has("second", "e"))
+        self.assertFalse(doc.has("second", "a"))
+        self.assertFalse(doc.has("default", "c"))
+        self.assertFalse(doc.has("missing", "a"))
+
+    def test_add_duplicate_sections(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        doc.add("default", "x", "1")
+        self.assertEqual(RESULT_ADD, "".join(doc.lines()))
+        self.assertTrue(doc.has("default", "x"))
+
+    def test_edits(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        doc.uncomment("default", "c")
+        doc.remove("second", "e")
+        doc.comment("default", "g")
+        doc.add("new", "n", "2")
+        self.assertEqual(RESULT_EDIT, "".join(doc.lines()))
+        self.assertTrue(doc.has("default", "c"))
+        self.assertFalse(doc.has("default", "g"))
+        self.assertTrue(doc.has("new", "n"))
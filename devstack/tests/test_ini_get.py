@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os.path
+import subprocess
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+BASIC = """[DEFAULT]
+debug = False
+transport_url = rabbit://stack:it's secret@localhost:5672/
+# commented = yes
+spaced=  value with spaces
+[database]
+connection = mysql+pymysql://root@127.0.0.1/nova
+[DEFAULT]
+debug = True
+"""
+
+
+class TestIniGet(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniGet, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+        self.stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout",
+                                             self.stdout.stream))
+
+    def _output(self):
+        self.stdout.stream.flush()
+        return self.stdout.getDetails()["stdout"].as_text()
+
+    def test_get(self):
+        conf = dsconf.IniFile(self._path)
+        # the last setting wins
+        self.assertEqual("True", conf.get("DEFAULT", "debug"))
+        self.assertEqual("value with spaces", conf.get("DEFAULT", "spaced"))
+        self.assertEqual("mysql+pymysql://root@127.0.0.1/nova",
+                         conf.get("database", "connection"))
+        self.assertIsNone(conf.get("DEFAULT", "commented"))
+        self.assertEqual("x", conf.get("missing", "debug", "x"))
+
+    def test_get_missing_file(self):
+        conf = dsconf.IniFile(os.path.join(self._dir, "missing.ini"))
+        self.assertIsNone(conf.get("DEFAULT", "debug"))
+
+    def test_get_many(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertEqual({"debug": "True", "missing": None},
+                         conf.get_many("DEFAULT", ["debug", "missing"]))
+
+    def test_document_get(self):
+        doc = dsconf.IniDocument(BASIC.splitlines(True))
+        doc.set("DEFAULT", "debug", "False")
+        self.assertEqual("False", doc.get("DEFAULT", "debug"))
+
+    def test_cli_raw(self):
+        self.assertEqual(0, cmd.main(["dsconf", "iniget", self._path,
+                                      "DEFAULT", "debug", "missing",
+                                      "spaced"]))
+        self.assertEqual("True\n\nvalue with spaces\n", self._output())
+
+    def test_cli_json(self):
+        cmd.main(["dsconf", "iniget", self._path, "DEFAULT", "debug",
+                  "missing", "--format", "json"])
+        self.assertEqual({"debug": "True", "missing": None},
+                         json.loads(self._output()))
+
+    def test_cli_shell(self):
+        cmd.main(["dsconf", "iniget", "--format", "shell", self._path,
+                  "DEFAULT", "transport_url", "missing", "spaced"])
+        output = self._output()
+        self.assertNotIn("missing", output)
+        # what the shell gets out of it
+        env = subprocess.run(
+            ["sh", "-c", output + 'printf "%s\\n" "$transport_url" '
+             '"${missing-unset}" "$spaced"'],
+            check=True, capture_output=True, text=True).stdout
+        self.assertEqual("rabbit://stack:it's secret@localhost:5672/\n"
+                         "unset\nvalue with spaces\n", env)
+
+    def test_shell_name(self):
+        self.assertEqual("a_b_c", cmd._shell_name("a-b.c"))
+        self.assertEqual("_1a", cmd._shell_name("1a"))
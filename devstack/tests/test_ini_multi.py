@@ -0,0 +1,141 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+from devstack import server
+
+
+BASIC = """[DEFAULT]
+debug = False
+"""
+
+DEBUG = """[DEFAULT]
+debug = True
+"""
+
+
+class TestIniMulti(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniMulti, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self.nova = self._write("nova.conf", BASIC)
+        self.glance = self._write("glance.conf", DEBUG)
+        self.stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout",
+                                             self.stdout.stream))
+        self.stderr = self.useFixture(fixtures.StringStream("stderr"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stderr",
+                                             self.stderr.stream))
+
+    def _write(self, name, content):
+        path = os.path.join(self._dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def _output(self, name):
+        fixture = getattr(self, name)
+        fixture.stream.flush()
+        return fixture.getDetails()[name].as_text()
+
+    def test_edit_all(self):
+        link = os.path.join(self._dir, "link.conf")
+        os.symlink(self.nova, link)
+        results = dsconf.edit_all(
+            [self.nova, self.glance, link],
+            lambda ini: ini.set("DEFAULT", "debug", "True"), max_workers=2)
+        # the link names a file that is already edited
+        self.assertEqual({self.nova: True, self.glance: False}, results)
+        self.assertEqual(DEBUG, self._read(self.nova))
+
+    def test_edit_all_error(self):
+        missing = os.path.join(self._dir, "missing", "x.conf")
+        results = dsconf.edit_all(
+            [missing, self.nova],
+            lambda ini: ini.set("DEFAULT", "debug", "True"))
+        self.assertIsInstance(results[missing], OSError)
+        self.assertTrue(results[self.nova])
+
+    def test_iniset_files(self):
+        ret = cmd.main(["dsconf", "--exit-code", "iniset", self.nova,
+                        self.glance, "DEFAULT", "debug", "True"])
+        self.assertEqual(0, ret)
+        self.assertEqual(DEBUG, self._read(self.nova))
+        self.assertEqual(
+            ["changed %s" % self.nova, "unchanged %s" % self.glance],
+            self._output("stdout").splitlines())
+
+    def test_iniset_glob(self):
+        argv = ["dsconf", "--exit-code", "iniset", "--jobs", "2",
+                os.path.join(self._dir, "*.conf"), "DEFAULT", "debug",
+                "True"]
+        self.assertEqual(0, cmd.main(argv))
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv))
+        self.assertEqual(DEBUG, self._read(self.nova))
+        self.assertEqual(
+            ["unchanged %s" % self.glance, "changed %s" % self.nova,
+             "unchanged %s" % self.glance, "unchanged %s" % self.nova],
+            self._output("stdout").splitlines())
+
+    def test_other_commands(self):
+        pattern = os.path.join(self._dir, "*.conf")
+        self.assertEqual(0, cmd.main(
+            ["dsconf", "inicomment", pattern, "DEFAULT", "debug"]))
+        self.assertEqual(0, cmd.main(
+            ["dsconf", "iniuncomment", pattern, "DEFAULT", "debug"]))
+        self.assertEqual(BASIC, self._read(self.nova))
+        self.assertEqual(0, cmd.main(
+            ["dsconf", "inirm", pattern, "DEFAULT", "debug"]))
+        self.assertEqual("[DEFAULT]\n", self._read(self.glance))
+
+    def test_no_match(self):
+        ret = cmd.main(["dsconf", "iniset", os.path.join(self._dir, "*.ini"),
+                        "DEFAULT", "debug", "True"])
+        self.assertEqual(1, ret)
+        self.assertIn("no file matches", self._output("stderr"))
+
+    def test_failed_file(self):
+        missing = os.path.join(self._dir, "missing", "x.conf")
+        ret = cmd.main(["dsconf", "iniset", missing, self.nova, "DEFAULT",
+                        "debug", "True"])
+        self.assertEqual(1, ret)
+        self.assertIn("dsconf: %s: " % missing, self._output("stderr"))
+        self.assertEqual(DEBUG, self._read(self.nova))
+
+    def test_single_file_is_quiet(self):
+        self.assertEqual(0, cmd.main(["dsconf", "iniset", self.nova,
+                                      "DEFAULT", "debug", "True"]))
+        self.assertEqual("", self._output("stdout"))
+
+    def test_operations(self):
+        pattern = os.path.join(self._dir, "*.conf")
+        ops = self._write("ops", "iniset %s DEFAULT debug True\n" % pattern)
+        self.assertEqual(0, cmd.main(["dsconf", "ini-apply", ops]))
+        self.assertEqual(DEBUG, self._read(self.nova))
+        dispatcher = server.Dispatcher()
+        self.assertEqual("ok", dispatcher.handle(
+            "iniset %s %s DEFAULT x 1" % (self.nova, self.glance)))
+        self.assertEqual("ok unchanged", dispatcher.handle(
+            "iniset %s DEFAULT x 1" % pattern))
+        self.assertIn("x = 1", self._read(self.glance))
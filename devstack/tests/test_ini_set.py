@@ -129,3 +129,57 @@ class TestIniCreate(testtools.TestCase):
         with open(self._path) as f:
             content = f.read()
             self.assertEqual(BASIC, content)
+
+
+DUPLICATE = """[default]
+a = b
+[second]
+e = f
+[default]
+c = d
+c = e
+"""
+
+DUPLICATE_SET = """[default]
+a = b
+[second]
+e = f
+[default]
+c = 2
+c = 2
+"""
+
+DUPLICATE_ADD = """[default]
+x = 2
+a = b
+[second]
+e = f
+[default]
+x = 2
+c = d
+c = e
+"""
+
+
+class TestIniSetDuplicate(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniSetDuplicate, self).setUp()
+        self._path = self.useFixture(fixtures.TempDir()).path
+        self._path += "/test.ini"
+        with open(self._path, "w") as f:
+            f.write(DUPLICATE)
+
+    def test_set_existing(self):
+        conf = dsconf.IniFile(self._path)
+        conf.set("default", "c", "2")
+        with open(self._path) as f:
+            content = f.read()
+            self.assertEqual(content, DUPLICATE_SET)
+
+    def test_set_new(self):
+        conf = dsconf.IniFile(self._path)
+        conf.set("default", "x", "2")
+        with open(self._path) as f:
+            content = f.read()
+            self.assertEqual(content, DUPLICATE_ADD)
@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+import stat
+import tracemalloc
+
+import fixtures
+import testtools
+
+from devstack import dsconf
+
+
+VALUE = "x" * 1000
+
+
+def _generate(path, size):
+    """Write an ini file of at least size bytes."""
+    written = 0
+    section = 0
+    with open(path, "w") as f:
+        while written < size:
+            chunk = "[section%d]\n# comment\n" % section
+            chunk += "".join("key%d = %s\n" % (k, VALUE) for k in range(8))
+            f.write(chunk)
+            written += len(chunk)
+            section += 1
+
+
+class TestIniStream(testtools.TestCase):
+
+    def setUp(self):
+        super(TestIniStream, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+
+    def _peak(self, func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_flat_memory(self):
+        conf = dsconf.IniFile(self._path)
+        peaks = []
+        for size in (10 * 2 ** 20, 110 * 2 ** 20):
+            _generate(self._path, size)
+            peaks.append(self._peak(
+                lambda: conf.set("section500", "key3", "new")))
+            self.assertTrue(conf.has("section500", "key3"))
+        # the whole file is never held in memory, and ten times the
+        # data needs no more memory than before.
+        self.assertLess(peaks[1], 2 ** 20)
+        self.assertLess(peaks[1], peaks[0] * 2)
+
+    def test_flat_memory_one_section(self):
+        with open(self._path, "w") as f:
+            f.write("[DEFAULT]\n")
+            for k in range(30000):
+                f.write("key%d = %s\n" % (k, VALUE))
+        conf = dsconf.IniFile(self._path)
+        # the key is found after it was optimistically added, so this
+        # streams the file twice.
+        peak = self._peak(lambda: conf.set("DEFAULT", "key29000", "new"))
+        self.assertLess(peak, 2 ** 20)
+        peak = self._peak(lambda: self.assertFalse(
+            conf.has("DEFAULT", "missing")))
+        self.assertLess(peak, 2 ** 20)
+        peak = self._peak(lambda: conf.remove("DEFAULT", "key5"))
+        self.assertLess(peak, 2 ** 20)
+        self.assertTrue(conf.has("DEFAULT", "key29000"))
+        self.assertFalse(conf.has("DEFAULT", "key5"))
+        with open(self._path) as f:
+            self.assertIn("key29000 = new\n", f.read())
+
+    def test_batch_replaces_file(self):
+        with open(self._path, "w") as f:
+            f.write("[default]\na = b\n")
+        os.chmod(self._path, 0o640)
+        inode = os.stat(self._path).st_ino
+        with dsconf.IniFile(self._path).batch() as b:
+            b.set("default", "a", "c")
+        st = os.stat(self._path)
+        self.assertNotEqual(inode, st.st_ino)
+        self.assertEqual(0o640, stat.S_IMODE(st.st_mode))
+        with open(self._path) as f:
+            self.assertEqual("[default]\na = c\n", f.read())
+
+    def test_keeps_mode(self):
+        with open(self._path, "w") as f:
+            f.write("[default]\na = b\n")
+        os.chmod(self._path, 0o640)
+        dsconf.IniFile(self._path).set("default", "a", "c")
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(self._path).st_mode))
+        self.assertEqual([], [f for f in os.listdir(self._dir)
+                              if f != "test.ini"])
+
+    def test_follows_symlink(self):
+        target = os.path.join(self._dir, "real.ini")
+        with open(target, "w") as f:
+            f.write("[default]\na = b\n")
+        os.symlink(target, self._path)
+        dsconf.IniFile(self._path).set("default", "a", "c")
+        self.assertTrue(os.path.islink(self._path))
+        with open(target) as f:
+            self.assertEqual("[default]\na = c\n", f.read())
+
+    def test_set_duplicate_restart(self):
+        with open(self._path, "w") as f:
+            f.write("[default]\na = b\n[other]\n[default]\nc = d\n")
+        dsconf.IniFile(self._path).set("default", "c", "e")
+        with open(self._path) as f:
+            self.assertEqual("[default]\na = b\n[other]\n[default]\nc = e\n",
+                             f.read())
@@ -0,0 +1,146 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import builtins
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import dsconf
+
+
+BASIC = """# preamble
+[[local|localrc]]
+a=b
+[[post-config|$NOVA_CONF]]
+  indented = 1
+[DEFAULT]
+c = d
+[upgrade_levels]
+compute = auto
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+e = f
+"""
+
+RESULT_SET = """# preamble
+[[local|localrc]]
+a=b
+x=1
+[[post-config|$NOVA_CONF]]
+  indented = 1
+[DEFAULT]
+c = 2
+[upgrade_levels]
+compute = auto
+[[post-config|$NOVA_CONF]]
+new = 3
+[DEFAULT]
+e = f
+[[post-config|$GLANCE_CONF]]
+[DEFAULT]
+g = 4
+"""
+
+
+class TestLocalConfDocument(testtools.TestCase):
+
+    def _doc(self, content=BASIC):
+        return dsconf.LocalConfDocument(content.splitlines(True))
+
+    def test_round_trip(self):
+        self.assertEqual(BASIC, "".join(self._doc().lines()))
+
+    def test_structure(self):
+        doc = self._doc()
+        self.assertEqual(
+            [None, "[[local|localrc]]\n", "[[post-config|$NOVA_CONF]]\n",
+             "[[post-config|$NOVA_CONF]]\n"],
+            [m.header for m in doc.metas])
+        self.assertEqual(
+            [None, "[DEFAULT]\n", "[upgrade_levels]\n"],
+            [s.header for s in doc.metas[2].sections])
+
+    def test_reads(self):
+        doc = self._doc()
+        self.assertEqual([("local", "localrc"), ("post-config", "$NOVA_CONF"),
+                          ("post-config", "$NOVA_CONF")], doc.groups())
+        self.assertTrue(doc.has_local_section())
+        self.assertEqual(["a=b\n"], list(doc.section("local", "localrc")))
+        self.assertEqual(
+            [("DEFAULT", "c", "d"),
+             ("upgrade_levels", "compute", "auto"), ("DEFAULT", "e", "f")],
+            list(doc.conf("post-config", "$NOVA_CONF")))
+
+    def test_edits(self):
+        doc = self._doc()
+        self.assertTrue(doc.set_local("x=1"))
+        self.assertTrue(doc.set("post-config", "$NOVA_CONF", "DEFAULT",
+                                "c", "2"))
+        self.assertFalse(doc.set("post-config", "$NOVA_CONF", "DEFAULT",
+                                 "c", "2"))
+        # a repeated meta section continues the section it ended
+        self.assertTrue(doc.set("post-config", "$NOVA_CONF",
+                                "upgrade_levels", "new", "3"))
+        self.assertTrue(doc.set("post-config", "$GLANCE_CONF", "DEFAULT",
+                                "g", "4"))
+        self.assertEqual(RESULT_SET, "".join(doc.lines()))
+        # the structure follows the edits
+        self.assertEqual(("post-config", "$GLANCE_CONF"), doc.groups()[-1])
+        self.assertEqual([("DEFAULT", "g", "4")],
+                         list(doc.conf("post-config", "$GLANCE_CONF")))
+
+    def test_indented_key(self):
+        doc = self._doc("[[post-config|$NOVA_CONF]]\n[DEFAULT]\n  a = 1\n")
+        doc.set("post-config", "$NOVA_CONF", "DEFAULT", "a", "2")
+        self.assertEqual("[[post-config|$NOVA_CONF]]\n[DEFAULT]\na = 2\n",
+                         "".join(doc.lines()))
+
+    def test_no_trailing_newline(self):
+        doc = self._doc("[[local|localrc]]\na=b")
+        doc.set_local("c=d")
+        self.assertEqual("[[local|localrc]]\na=bc=d\n", "".join(doc.lines()))
+
+    def test_set_local_without_local(self):
+        doc = self._doc("[[post-config|$NOVA_CONF]]\n")
+        doc.set_local("c=d")
+        self.assertEqual(
+            "[[local|localrc]]\nc=d\n[[post-config|$NOVA_CONF]]\n",
+            "".join(doc.lines()))
+        self.assertTrue(doc.has_local_section())
+
+    def test_missing_file(self):
+        doc = dsconf.LocalConfDocument()
+        doc.set_local("a=b")
+        doc.set("post-config", "$NOVA_CONF", "DEFAULT", "c", "d")
+        self.assertEqual(
+            "[[local|localrc]]\na=b\n[[post-config|$NOVA_CONF]]\n"
+            "[DEFAULT]\nc = d\n", "".join(doc.lines()))
+
+    def test_single_read(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(tmp, "local.conf")
+        with open(path, "w") as f:
+            f.write(BASIC)
+        opened = []
+        real_open = builtins.open
+
+        def _open(fname, *args, **kwargs):
+            if fname == path:
+                opened.append(args[:1])
+            return real_open(fname, *args, **kwargs)
+
+        self.useFixture(fixtures.MonkeyPatch("builtins.open", _open))
+        dsconf.LocalConf(path).set_local("x=1")
+        # one read to parse, one to compare with the new content
+        self.assertEqual(2, len(opened))
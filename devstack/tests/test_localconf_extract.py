@@ -16,8 +16,11 @@
 # python ConfigFile parser because that ends up rewriting the entire
 # file and doesn't ensure comments remain.
 
-import fixtures
+import errno
+import os
 import os.path
+
+import fixtures
 import testtools
 
 from devstack import dsconf
@@ -138,3 +141,149 @@ class TestLcExtract(testtools.TestCase):
         with open(localrc) as f:
             content = f.read()
             self.assertEqual(content, LOCALRC_RES)
+
+
+DUPLICATES = """[[post-config|$NOVA_CONF]]
+[DEFAULT]
+a = 1
+b = 2
+a = 3
+[other]
+c = 4
+"""
+
+DUPLICATES_RES = """[DEFAULT]
+b = 2
+a = 3
+[other]
+c = 4
+"""
+
+
+class TestLcExtractBatch(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLcExtractBatch, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        self._target = os.path.join(self._dir, "nova.conf")
+        with open(self._path, "w") as f:
+            f.write(DUPLICATES)
+        self.writes = []
+        real_replace_file = dsconf._replace_file
+
+        def _replace_file(fname, fsync=None):
+            self.writes.append(fname)
+            return real_replace_file(fname, fsync)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf._replace_file", _replace_file))
+
+    def test_single_write(self):
+        conf = dsconf.LocalConf(self._path)
+        self.assertTrue(conf.extract("post-config", "$NOVA_CONF",
+                                     self._target))
+        self.assertEqual([self._target], self.writes)
+        with open(self._target) as f:
+            self.assertEqual(DUPLICATES_RES, f.read())
+
+    def test_unchanged(self):
+        conf = dsconf.LocalConf(self._path)
+        conf.extract("post-config", "$NOVA_CONF", self._target)
+        ino = os.stat(self._target).st_ino
+        self.assertFalse(conf.extract("post-config", "$NOVA_CONF",
+                                      self._target))
+        self.assertEqual(ino, os.stat(self._target).st_ino)
+
+    def test_no_settings(self):
+        conf = dsconf.LocalConf(self._path)
+        self.assertFalse(conf.extract("post-config", "$MISSING",
+                                      self._target))
+        self.assertFalse(os.path.exists(self._target))
+
+
+SEVERAL_LOCALRC = """# preamble
+[[local|localrc]]
+a=1
+[[ -n $X ]] && echo
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+b = 2
+[[local|localrc]]
+c=3
+[[local|localrc]]"""
+
+
+class TestLcExtractLocalrc(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLcExtractLocalrc, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        self._target = os.path.join(self._dir, "localrc")
+
+    def _extract(self, content):
+        with open(self._path, "w", newline="") as f:
+            f.write(content)
+        changed = dsconf.LocalConf(self._path).extract_localrc(self._target)
+        with open(self._target) as f:
+            return changed, f.read()
+
+    def test_ranges(self):
+        data = SEVERAL_LOCALRC.encode()
+        self.assertEqual(
+            ["a=1\n[[ -n $X ]] && echo\n", "c=3\n"],
+            [data[start:end].decode() for start, end in
+             dsconf._meta_ranges(data, b"[[local|localrc]]")])
+
+    def test_same_as_section(self):
+        for content in (SEVERAL_LOCALRC, BASIC, "[[local|localrc]]\na=b",
+                        "a=b\n", "[[local|localrc]]\n[[local|localrc]]\n"):
+            expected = "".join(dsconf.LocalConfDocument(
+                content.splitlines(True)).section("local", "localrc"))
+            if os.path.exists(self._target):
+                os.unlink(self._target)
+            self.assertEqual((True, expected), self._extract(content))
+
+    def test_empty_file(self):
+        self.assertEqual((True, ""), self._extract(""))
+        self.assertEqual((False, ""), self._extract(""))
+
+    def test_unchanged(self):
+        self._extract("[[post-config|$NOVA_CONF]]\n[DEFAULT]\na = 1\n")
+        self.assertEqual(
+            (False, ""),
+            self._extract("[[post-config|$NOVA_CONF]]\n[DEFAULT]\na = 1\n"))
+
+    def test_appends(self):
+        self._extract(BASIC)
+        self.assertEqual((True, "a = b\nc = d\nf = 1\n" * 2),
+                         self._extract(BASIC))
+
+    def test_carriage_returns(self):
+        self.assertEqual(
+            (True, "a=1\nb=2\n"),
+            self._extract("[[local|localrc]]\r\na=1\r\nb=2\r[[x|y]]\r\n"))
+
+    def test_copy_file_range(self):
+        copies = []
+        real_copy = getattr(os, "copy_file_range", None)
+
+        def _copy(src, dst, count, offset_src=None):
+            copies.append((count, offset_src))
+            if real_copy is None:
+                raise OSError(errno.ENOSYS, "not implemented")
+            return real_copy(src, dst, count, offset_src)
+
+        self.useFixture(fixtures.MonkeyPatch("os.copy_file_range", _copy))
+        self.assertEqual((True, "a=1\n[[ -n $X ]] && echo\nc=3\n"),
+                         self._extract(SEVERAL_LOCALRC))
+        self.assertEqual([(24, 29), (4, 114)], copies)
+
+    def test_copy_file_range_unsupported(self):
+        def _copy(*args):
+            raise OSError(errno.EXDEV, "cross-device link")
+
+        self.useFixture(fixtures.MonkeyPatch("os.copy_file_range", _copy))
+        self.assertEqual((True, "a=1\n[[ -n $X ]] && echo\nc=3\n"),
+                         self._extract(SEVERAL_LOCALRC))
@@ -0,0 +1,142 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+LOCAL_CONF = """[[local|localrc]]
+a=b
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+[[post-config|${NEUTRON_DIR}/neutron.conf]]
+[DEFAULT]
+a = 1
+[[post-extra|$TEMPEST_CONF]]
+[DEFAULT]
+x = y
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = False
+[[post-config|$NOVA_ALIAS]]
+[api]
+b = 2
+"""
+
+NOVA = """[DEFAULT]
+debug = False
+[api]
+b = 2
+"""
+
+NEUTRON = """[DEFAULT]
+a = 1
+"""
+
+
+class TestExtractAll(testtools.TestCase):
+
+    def setUp(self):
+        super(TestExtractAll, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        with open(self._path, "w") as f:
+            f.write(LOCAL_CONF)
+        self.nova = os.path.join(self._dir, "nova.conf")
+        self.neutron = os.path.join(self._dir, "neutron.conf")
+        self.variables = {
+            "NOVA_CONF": self.nova,
+            "NOVA_ALIAS": os.path.join(self._dir, ".", "nova.conf"),
+            "NEUTRON_DIR": self._dir,
+        }
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_expand_vars(self):
+        self.assertEqual("/etc/a/b.conf", dsconf.expand_vars(
+            "/etc/$A/${B}.conf", {"A": "a", "B": "b"}))
+        self.assertRaises(KeyError, dsconf.expand_vars, "$C", {})
+
+    def test_extract_all(self):
+        results = dsconf.LocalConf(self._path).extract_all(
+            "post-config", self.variables, max_workers=2)
+        self.assertEqual({self.nova: True, self.neutron: True}, results)
+        # both headers for nova.conf are applied by one writer, in order
+        self.assertEqual(NOVA, self._read(self.nova))
+        self.assertEqual(NEUTRON, self._read(self.neutron))
+        self.assertFalse(os.path.exists(
+            os.path.join(self._dir, "tempest.conf")))
+
+    def test_same_as_extract(self):
+        dsconf.LocalConf(self._path).extract_all(
+            "post-config", self.variables)
+        expected = os.path.join(self._dir, "expected.conf")
+        conf = dsconf.LocalConf(self._path)
+        for header in ("$NOVA_CONF", "$NOVA_ALIAS"):
+            conf.extract("post-config", header, expected)
+        self.assertEqual(self._read(expected), self._read(self.nova))
+
+    def test_unchanged(self):
+        conf = dsconf.LocalConf(self._path)
+        conf.extract_all("post-config", self.variables)
+        self.assertEqual({self.nova: False, self.neutron: False},
+                         conf.extract_all("post-config", self.variables))
+
+    def test_undefined_variable(self):
+        del self.variables["NEUTRON_DIR"]
+        conf = dsconf.LocalConf(self._path)
+        self.assertRaises(KeyError, conf.extract_all, "post-config",
+                          self.variables)
+        self.assertFalse(os.path.exists(self.nova))
+
+    def test_write_error(self):
+        self.variables["NEUTRON_DIR"] = os.path.join(self._dir, "missing")
+        results = dsconf.LocalConf(self._path).extract_all(
+            "post-config", self.variables)
+        self.assertTrue(results[self.nova])
+        self.assertIsInstance(
+            results[os.path.join(self._dir, "missing", "neutron.conf")],
+            OSError)
+
+    def test_cli(self):
+        stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout", stdout.stream))
+        self.useFixture(fixtures.EnvironmentVariable(
+            "NEUTRON_DIR", self._dir))
+        argv = ["dsconf", "--exit-code", "extract-all", self._path, "--env",
+                "--var", "NOVA_CONF=%s" % self.nova,
+                "--var", "NOVA_ALIAS=%s" % self.nova, "--jobs", "2"]
+        self.assertEqual(0, cmd.main(argv))
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv))
+        stdout.stream.flush()
+        self.assertEqual(
+            ["changed %s" % self.nova, "changed %s" % self.neutron,
+             "unchanged %s" % self.nova, "unchanged %s" % self.neutron],
+            stdout.getDetails()["stdout"].as_text().splitlines())
+        self.assertEqual(NOVA, self._read(self.nova))
+
+    def test_cli_undefined(self):
+        stderr = self.useFixture(fixtures.StringStream("stderr"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stderr", stderr.stream))
+        self.assertEqual(1, cmd.main(["dsconf", "extract-all", self._path]))
+        stderr.stream.flush()
+        self.assertIn("variable 'NOVA_CONF' is not defined",
+                      stderr.getDetails()["stderr"].as_text())
@@ -20,6 +20,7 @@ import fixtures
 import os.path
 import testtools
 
+from devstack import cmd
 from devstack import dsconf
 
 
@@ -205,3 +206,90 @@ class TestLcMergePost(testtools.TestCase):
         with open(self._path) as f:
             content = f.read()
             self.assertEqual(content, RESULT4)
+
+
+class TestLcMergeBatch(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLcMergeBatch, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+        self._sources = []
+        for i, content in enumerate((LC1, LC2, LC3)):
+            source = os.path.join(self._dir, "source%d.conf" % i)
+            with open(source, "w") as f:
+                f.write(content)
+            self._sources.append(source)
+        self.writes = []
+        real_replace_file = dsconf._replace_file
+
+        def _replace_file(fname, fsync=None):
+            self.writes.append(fname)
+            return real_replace_file(fname, fsync)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf._replace_file", _replace_file))
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_single_write(self):
+        conf = dsconf.LocalConf(self._path)
+        self.assertTrue(conf.merge_lc(self._sources[2]))
+        self.assertEqual(1, len(self.writes))
+
+    def test_cli_many_sources(self):
+        expected = os.path.join(self._dir, "expected.conf")
+        with open(expected, "w") as f:
+            f.write(BASIC)
+        for source in self._sources:
+            dsconf.LocalConf(expected).merge_lc(source)
+        del self.writes[:]
+
+        cmd.main(["dsconf", "merge_lc", self._path] + self._sources)
+        self.assertEqual(1, len(self.writes))
+        self.assertEqual(self._read(expected), self._read(self._path))
+
+    def test_unchanged(self):
+        conf = dsconf.LocalConf(self._path)
+        conf.merge_lc(self._sources[2])
+        del self.writes[:]
+        self.assertFalse(conf.merge_lc(self._sources[2]))
+        self.assertEqual([], self.writes)
+
+    def test_parallel_parse(self):
+        expected = os.path.join(self._dir, "expected.conf")
+        with open(expected, "w") as f:
+            f.write(BASIC)
+        dsconf.LocalConf(expected).merge_lc(*self._sources)
+
+        conf = dsconf.LocalConf(self._path)
+        self.assertTrue(conf.merge_lc(*(self._sources * 4), jobs=3))
+        for source in self._sources * 3:
+            dsconf.LocalConf(expected).merge_lc(source)
+        self.assertEqual(self._read(expected), self._read(self._path))
+
+    def test_cli_jobs(self):
+        expected = os.path.join(self._dir, "expected.conf")
+        with open(expected, "w") as f:
+            f.write(BASIC)
+        dsconf.LocalConf(expected).merge_lc(*self._sources)
+        cmd.main(["dsconf", "merge_lc", "--jobs", "2", self._path] +
+                 self._sources)
+        self.assertEqual(self._read(expected), self._read(self._path))
+
+    def test_merge_operations(self):
+        doc = dsconf.LocalConfDocument(LC1.splitlines(True))
+        ops = list(doc.merge_operations())
+        self.assertTrue(ops)
+        for op in ops:
+            self.assertIn(op[0], ("set_local", "set"))
+            self.assertTrue(all(isinstance(arg, str) for arg in op[1:]))
+        target = dsconf.LocalConfDocument(BASIC.splitlines(True))
+        other = dsconf.LocalConfDocument(BASIC.splitlines(True))
+        target.apply(ops)
+        other.merge(doc)
+        self.assertEqual(list(other.lines()), list(target.lines()))
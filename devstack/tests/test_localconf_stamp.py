@@ -0,0 +1,156 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+LOCAL_CONF = """[[local|localrc]]
+A=1
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+[[post-config|$NOVA_ALIAS]]
+[api]
+workers = 2
+"""
+
+
+class TestStamp(testtools.TestCase):
+
+    def setUp(self):
+        super(TestStamp, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        self._write(self._path, LOCAL_CONF)
+        self.target = os.path.join(self._dir, "nova.conf")
+        self.stamp_file = os.path.join(self._dir, "stamp")
+        self.extracted = []
+        real_document = dsconf.IniFile._document
+
+        def _document(ini, missing_ok=False):
+            self.extracted.append(ini.fname)
+            return real_document(ini, missing_ok)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf.IniFile._document", _document))
+
+    def _write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def _extract(self, conf="$NOVA_CONF", force=False):
+        return dsconf.LocalConf(self._path).extract(
+            "post-config", conf, self.target,
+            dsconf.StampFile(self.stamp_file), force)
+
+    def test_skips_unchanged(self):
+        self.assertTrue(self._extract())
+        ino = os.stat(self.target).st_ino
+        self.assertFalse(self._extract())
+        self.assertEqual([self.target], self.extracted)
+        self.assertEqual(ino, os.stat(self.target).st_ino)
+        self.assertEqual("[DEFAULT]\ndebug = True\n", self._read(self.target))
+
+    def test_section_changed(self):
+        self._extract()
+        self._write(self._path, LOCAL_CONF.replace("True", "False"))
+        self.assertTrue(self._extract())
+        self.assertEqual("[DEFAULT]\ndebug = False\n",
+                         self._read(self.target))
+
+    def test_target_changed(self):
+        self._extract()
+        self._write(self.target, "[DEFAULT]\ndebug = Nope\n")
+        self.assertTrue(self._extract())
+        self.assertEqual("[DEFAULT]\ndebug = True\n", self._read(self.target))
+
+    def test_target_touched(self):
+        self._extract()
+        os.utime(self.target, ns=(0, 0))
+        self.assertFalse(self._extract())
+        self.assertEqual(1, len(self.extracted))
+        # the new mtime is remembered, the target is not hashed again
+        digests = []
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf._file_digest", digests.append))
+        self.assertFalse(self._extract())
+        self.assertEqual([], digests)
+
+    def test_target_removed(self):
+        self._extract()
+        os.unlink(self.target)
+        self.assertTrue(self._extract())
+
+    def test_force(self):
+        self._extract()
+        self.assertFalse(self._extract(force=True))
+        self.assertEqual(2, len(self.extracted))
+
+    def test_shared_target(self):
+        self._extract()
+        # a section that changed the target makes the others stale
+        self.assertTrue(self._extract("$NOVA_ALIAS"))
+        self.assertFalse(self._extract())
+        self.assertEqual(3, len(self.extracted))
+        self.assertFalse(self._extract())
+        self.assertFalse(self._extract("$NOVA_ALIAS"))
+        self.assertEqual(3, len(self.extracted))
+        self._write(self._path, LOCAL_CONF.replace("True", "False"))
+        self.assertTrue(self._extract())
+        self.assertFalse(self._extract("$NOVA_ALIAS"))
+        self.assertFalse(self._extract())
+        self.assertEqual(5, len(self.extracted))
+
+    def test_bad_stamp(self):
+        self._write(self.stamp_file, "{not json")
+        self.assertTrue(self._extract())
+        self.assertFalse(self._extract())
+        self.assertEqual(1, len(self.extracted))
+
+    def test_localrc(self):
+        localrc = os.path.join(self._dir, "localrc")
+        conf = dsconf.LocalConf(self._path)
+        stamp = dsconf.StampFile(self.stamp_file)
+        self.assertTrue(conf.extract_localrc(localrc, stamp))
+        self.assertFalse(conf.extract_localrc(localrc, stamp))
+        self.assertEqual("A=1\n", self._read(localrc))
+        self._write(self._path, LOCAL_CONF.replace("A=1", "A=2"))
+        self.assertTrue(conf.extract_localrc(localrc, stamp))
+        self.assertEqual("A=1\nA=2\n", self._read(localrc))
+        self.assertTrue(conf.extract_localrc(localrc, stamp, force=True))
+        self.assertEqual("A=1\nA=2\nA=2\n", self._read(localrc))
+
+    def test_cli(self):
+        argv = ["dsconf", "--exit-code", "extract", "--stamp",
+                self.stamp_file, self._path, "post-config", "$NOVA_CONF",
+                self.target]
+        self.assertEqual(0, cmd.main(argv))
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv))
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv + ["--force"]))
+        self.assertEqual(2, len(self.extracted))
+        localrc = os.path.join(self._dir, "localrc")
+        argv = ["dsconf", "--exit-code", "extract-localrc", self._path,
+                localrc, "--stamp", self.stamp_file]
+        self.assertEqual(0, cmd.main(argv))
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(argv))
+        self.assertEqual("A=1\n", self._read(localrc))
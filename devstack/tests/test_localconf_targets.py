@@ -0,0 +1,172 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+LOCAL_CONF = """[[local|localrc]]
+DEST=/opt/stack
+export NOVA_CONF=$DEST/nova.conf
+NEUTRON_CONF="${NEUTRON_DIR:-$DEST/neutron}/neutron.conf"
+enable_service q-svc
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+[[post-config|$NEUTRON_CONF]]
+[DEFAULT]
+a = 1
+[[post-extra|$NOVA_CONF]]
+[DEFAULT]
+b = 2
+[[post-config|$NOVA_CONF]]
+[api]
+c = 3
+"""
+
+
+class TestSymbolTable(testtools.TestCase):
+
+    def test_read_shell(self):
+        symbols = dsconf.SymbolTable({"HOME": "/root"}).read_shell([
+            "A=1\n",
+            "export B=$A/b  # comment\n",
+            "C='$A'\n",
+            'D="${A}d"\n',
+            "E=${MISSING}e\n",
+            "A=$A$A\n",
+            "# F=6\n",
+            "enable_plugin x y\n",
+        ])
+        self.assertEqual(
+            ["11", "1/b", "$A", "1d", "e", "/root", "default"],
+            [symbols.resolve(t) for t in
+             ("$A", "$B", "$C", "$D", "$E", "$HOME", "${F:-default}")])
+        self.assertRaises(KeyError, symbols.resolve, "$F")
+
+    def test_memoized(self):
+        symbols = dsconf.SymbolTable({"A": "1"})
+        calls = []
+        real_expand = symbols._expand
+
+        def _expand(text, strict):
+            calls.append(text)
+            return real_expand(text, strict)
+
+        symbols._expand = _expand
+        self.assertEqual("1", symbols.resolve("$A"))
+        self.assertEqual("1", symbols.resolve("$A"))
+        self.assertEqual(1, len(calls))
+        symbols.update({"A": "2"})
+        self.assertEqual("2", symbols.resolve("$A"))
+        self.assertEqual(2, len(calls))
+
+    def test_sources(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        vars_file = os.path.join(tmp, "vars")
+        with open(vars_file, "w") as f:
+            f.write("A=file\nB=file\n")
+        self.useFixture(fixtures.EnvironmentVariable("A", "env"))
+        symbols = dsconf.SymbolTable().read_env().read_file(vars_file)
+        self.assertEqual("file", symbols.resolve("$A"))
+        symbols.read_env({"B": "mapping"})
+        self.assertEqual("mapping", symbols.resolve("$B"))
+
+
+class TestTargets(testtools.TestCase):
+
+    def setUp(self):
+        super(TestTargets, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "local.conf")
+        with open(self._path, "w") as f:
+            f.write(LOCAL_CONF.replace("/opt/stack", self._dir))
+        self.nova = os.path.join(self._dir, "nova.conf")
+        self.neutron = os.path.join(self._dir, "neutron", "neutron.conf")
+
+    def _symbols(self):
+        return dsconf.SymbolTable().read_localrc(self._path)
+
+    def test_targets(self):
+        conf = dsconf.LocalConf(self._path, symbols=self._symbols())
+        self.assertEqual(
+            {("post-config", "$NOVA_CONF"): self.nova,
+             ("post-config", "$NEUTRON_CONF"): self.neutron,
+             ("post-extra", "$NOVA_CONF"): self.nova},
+            conf.targets())
+        self.assertEqual(
+            [("post-extra", "$NOVA_CONF")],
+            list(conf.targets("post-extra")))
+
+    def test_symbols_argument(self):
+        conf = dsconf.LocalConf(self._path)
+        self.assertRaises(KeyError, conf.targets)
+        self.assertEqual(
+            {("post-extra", "$NOVA_CONF"): "/x"},
+            conf.targets("post-extra", dsconf.SymbolTable({"NOVA_CONF":
+                                                           "/x"})))
+
+    def test_extract_all(self):
+        os.mkdir(os.path.dirname(self.neutron))
+        conf = dsconf.LocalConf(self._path, symbols=self._symbols())
+        self.assertEqual({self.nova: True, self.neutron: True},
+                         conf.extract_all("post-config"))
+        with open(self.nova) as f:
+            self.assertEqual("[DEFAULT]\ndebug = True\n[api]\nc = 3\n",
+                             f.read())
+
+    def _main(self, argv, stream="stdout"):
+        out = self.useFixture(fixtures.StringStream(stream))
+        self.useFixture(fixtures.MonkeyPatch("sys." + stream, out.stream))
+        ret = cmd.main(["dsconf"] + argv)
+        out.stream.flush()
+        return ret, out.getDetails()[stream].as_text()
+
+    def test_cli(self):
+        ret, out = self._main(["targets", self._path, "--localrc",
+                               "--var", "NOVA_CONF=/etc/nova.conf"])
+        self.assertEqual(0, ret)
+        self.assertEqual(
+            ["post-config\t$NOVA_CONF\t/etc/nova.conf",
+             "post-config\t$NEUTRON_CONF\t%s" % self.neutron,
+             "post-extra\t$NOVA_CONF\t/etc/nova.conf"],
+            out.splitlines())
+
+    def test_cli_json(self):
+        vars_file = os.path.join(self._dir, "vars")
+        with open(vars_file, "w") as f:
+            f.write("NOVA_CONF=/etc/nova.conf\n")
+        ret, out = self._main(["targets", self._path, "--group",
+                               "post-extra", "--vars-file", vars_file,
+                               "--format", "json"])
+        self.assertEqual(
+            [{"group": "post-extra", "conf": "$NOVA_CONF",
+              "path": "/etc/nova.conf"}], json.loads(out))
+
+    def test_cli_undefined(self):
+        ret, err = self._main(["targets", self._path], "stderr")
+        self.assertEqual(1, ret)
+        self.assertIn("variable 'NOVA_CONF' is not defined", err)
+
+    def test_cli_extract_all(self):
+        os.mkdir(os.path.dirname(self.neutron))
+        ret, out = self._main(["extract-all", self._path, "--localrc"])
+        self.assertEqual(
+            ["changed %s" % self.nova, "changed %s" % self.neutron],
+            out.splitlines())
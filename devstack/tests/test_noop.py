@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+BASIC = """[default]
+a = b
+# c = d
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+a=b
+[[post-config|$NOVA_CONF]]
+[default]
+a = b
+"""
+
+
+class TestNoop(testtools.TestCase):
+
+    def setUp(self):
+        super(TestNoop, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+        # an mtime that any rewrite would change
+        os.utime(self._path, ns=(0, 0))
+
+    def _untouched(self, path=None):
+        st = os.stat(path or self._path)
+        return st.st_mtime_ns == 0
+
+    def test_set_same_value(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertFalse(conf.set("default", "a", "b"))
+        self.assertTrue(self._untouched())
+        self.assertEqual(["test.ini"], os.listdir(self._dir))
+
+    def test_set_new_value(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertTrue(conf.set("default", "a", "c"))
+        self.assertFalse(self._untouched())
+
+    def test_add_always_changes(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertTrue(conf.add("default", "a", "b"))
+        self.assertTrue(conf.add("other", "a", "b"))
+
+    def test_missing_keys(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertFalse(conf.remove("default", "missing"))
+        self.assertFalse(conf.comment("default", "missing"))
+        self.assertFalse(conf.uncomment("default", "a"))
+        self.assertTrue(self._untouched())
+
+    def test_comment_uncomment(self):
+        conf = dsconf.IniFile(self._path)
+        self.assertTrue(conf.comment("default", "a"))
+        self.assertTrue(conf.uncomment("default", "c"))
+
+    def test_new_file(self):
+        path = os.path.join(self._dir, "new.ini")
+        self.assertTrue(dsconf.IniFile(path).set("default", "a", "b"))
+
+    def test_batch(self):
+        conf = dsconf.IniFile(self._path)
+        with conf.batch() as doc:
+            self.assertFalse(doc.set("default", "a", "b"))
+            self.assertFalse(doc.remove("default", "missing"))
+            self.assertFalse(doc.changed)
+        self.assertTrue(self._untouched())
+
+    def test_batch_changed_back(self):
+        conf = dsconf.IniFile(self._path)
+        with conf.batch() as doc:
+            self.assertTrue(doc.set("default", "a", "c"))
+            self.assertTrue(doc.set("default", "a", "b"))
+            self.assertTrue(doc.changed)
+        # the content is the same, so the file still is not written
+        self.assertTrue(self._untouched())
+
+    def test_document_save(self):
+        doc = dsconf.IniDocument.load(self._path)
+        self.assertFalse(doc.save())
+        self.assertTrue(self._untouched())
+        doc.set("default", "a", "c")
+        self.assertTrue(doc.save())
+        self.assertFalse(doc.changed)
+
+    def test_localconf(self):
+        lc = os.path.join(self._dir, "local.conf")
+        with open(lc, "w") as f:
+            f.write(LOCAL_CONF)
+        os.utime(lc, ns=(0, 0))
+        conf = dsconf.LocalConf(lc)
+        self.assertFalse(conf.set("post-config", "$NOVA_CONF", "default",
+                                  "a", "b"))
+        self.assertTrue(self._untouched(lc))
+        self.assertFalse(conf.extract("post-config", "$NOVA_CONF",
+                                      self._path))
+        self.assertTrue(self._untouched())
+        self.assertTrue(conf.set("post-config", "$NOVA_CONF", "default",
+                                 "a", "c"))
+        self.assertTrue(conf.extract("post-config", "$NOVA_CONF",
+                                     self._path))
+
+    def test_exit_code(self):
+        iniset = ["dsconf", "--exit-code", "iniset", self._path,
+                  "default", "a"]
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(iniset + ["b"]))
+        self.assertEqual(0, cmd.main(iniset + ["c"]))
+        self.assertEqual(0, cmd.main(iniset[:1] + iniset[2:] + ["c"]))
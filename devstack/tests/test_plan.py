@@ -0,0 +1,165 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+BASIC = """[default]
+a = b
+c = d
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+A=1
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+"""
+
+
+class TestPlan(testtools.TestCase):
+
+    def setUp(self):
+        super(TestPlan, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self.ini = os.path.join(self._dir, "test.ini")
+        self.lc = os.path.join(self._dir, "local.conf")
+        self._write(self.ini, BASIC)
+        self._write(self.lc, LOCAL_CONF)
+        self.stdout = self.useFixture(fixtures.StringStream("stdout"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stdout",
+                                             self.stdout.stream))
+
+    def _write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+        # an mtime that any rewrite would change
+        os.utime(path, ns=(0, 0))
+
+    def _output(self):
+        self.stdout.stream.flush()
+        return self.stdout.getDetails()["stdout"].as_text()
+
+    def _untouched(self):
+        for path in (self.ini, self.lc):
+            self.assertEqual(0, os.stat(path).st_mtime_ns)
+        self.assertEqual(["local.conf", "test.ini"],
+                         sorted(os.listdir(self._dir)))
+
+    def test_diff(self):
+        self.assertEqual(0, cmd.main(["dsconf", "--exit-code", "iniset",
+                                      self.ini, "default", "a", "x",
+                                      "--plan"]))
+        self.assertEqual(
+            "--- %s\n+++ %s\n@@ -1,3 +1,3 @@\n [default]\n-a = b\n+a = x\n"
+            " c = d\n" % (self.ini, self.ini), self._output())
+        self._untouched()
+
+    def test_unchanged(self):
+        self.assertEqual(cmd.EXIT_UNCHANGED, cmd.main(
+            ["dsconf", "--exit-code", "iniset", self.ini, "default", "a",
+             "b", "--plan"]))
+        self.assertEqual("", self._output())
+        self._untouched()
+
+    def test_json(self):
+        cmd.main(["dsconf", "inirm", "--plan=json", self.ini, "default",
+                  "c"])
+        self.assertEqual(
+            [{"file": self.ini, "created": False,
+              "edits": [{"op": "delete", "line": 3, "old": ["c = d\n"],
+                         "new": []}]}],
+            json.loads(self._output()))
+        self._untouched()
+
+    def test_new_file(self):
+        new = os.path.join(self._dir, "new.ini")
+        cmd.main(["dsconf", "iniset", new, "default", "a", "b", "--plan"])
+        self.assertEqual(
+            "--- /dev/null\n+++ %s\n@@ -0,0 +1,2 @@\n+[default]\n"
+            "+a = b\n" % new, self._output())
+        self._untouched()
+
+    def test_no_newline_at_end(self):
+        plan = dsconf.Plan()
+        plan.record("f", "a\n", "a\nb")
+        self.assertEqual(
+            "--- f\n+++ f\n@@ -1 +1,2 @@\n a\n+b\n"
+            "\\ No newline at end of file\n", plan.diff())
+
+    def test_localconf_commands(self):
+        nova = os.path.join(self._dir, "nova.conf")
+        localrc = os.path.join(self._dir, "localrc")
+        source = os.path.join(self._dir, "source.conf")
+        with open(source, "w") as f:
+            f.write("[[local|localrc]]\nB=2\n")
+        os.utime(source, ns=(0, 0))
+        for argv in (["setlc", self.lc, "B", "2"],
+                     ["setlc_raw", self.lc, "B=2"],
+                     ["setlc_conf", self.lc, "post-config", "$NOVA_CONF",
+                      "DEFAULT", "debug", "False"],
+                     ["merge_lc", self.lc, source],
+                     ["extract", self.lc, "post-config", "$NOVA_CONF", nova],
+                     ["extract-localrc", self.lc, localrc]):
+            self.assertEqual(0, cmd.main(["dsconf", "--exit-code"] + argv +
+                                         ["--plan"]))
+        output = self._output()
+        self.assertIn("+B=2\n", output)
+        self.assertIn("+debug = False\n", output)
+        self.assertIn("+++ %s\n" % nova, output)
+        self.assertIn("+++ %s\n" % localrc, output)
+        os.unlink(source)
+        self._untouched()
+
+    def test_ini_apply(self):
+        other = os.path.join(self._dir, "other.ini")
+        ops = os.path.join(self._dir, "ops")
+        with open(ops, "w") as f:
+            f.write("iniset %s default a x\niniset %s default b y\n"
+                    "iniset %s default e f\n" % (self.ini, other, self.ini))
+        cmd.main(["dsconf", "ini-apply", ops, "--plan=json"])
+        edits = json.loads(self._output())
+        self.assertEqual([self.ini, other], [e["file"] for e in edits])
+        self.assertEqual([False, True], [e["created"] for e in edits])
+        os.unlink(ops)
+        self._untouched()
+
+    def test_operations_reject_plan(self):
+        parser = cmd.build_parser(cmd.OperationParser)
+        self.assertRaises(
+            cmd.OperationError, cmd.parse_operation,
+            "iniset %s default a b --plan" % self.ini, parser)
+
+    def test_planning(self):
+        with dsconf.planning() as plan:
+            with dsconf.IniFile(self.ini).batch() as doc:
+                doc.set("default", "a", "x")
+                doc.set("default", "e", "f")
+            self.assertTrue(dsconf.LocalConf(self.lc).set_local("B=2"))
+            self.assertFalse(dsconf.IniFile(self.ini).set("default", "c",
+                                                          "d"))
+        self.assertEqual(
+            [(self.ini, BASIC, "[default]\ne = f\na = x\nc = d\n"),
+             (self.lc, LOCAL_CONF, LOCAL_CONF.replace("A=1\n", "A=1\nB=2\n"))],
+            plan.changes())
+        self._untouched()
+        # planning ended, so edits are written again
+        dsconf.IniFile(self.ini).set("default", "a", "x")
+        self.assertNotEqual(0, os.stat(self.ini).st_mtime_ns)
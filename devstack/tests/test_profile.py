@@ -0,0 +1,145 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os.path
+import re
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import dsconf
+
+
+BASIC = """[default]
+a = b
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+A=1
+[[post-config|$NOVA_CONF]]
+[DEFAULT]
+debug = True
+"""
+
+
+class TestProfile(testtools.TestCase):
+
+    def setUp(self):
+        super(TestProfile, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+        self.lc = os.path.join(self._dir, "local.conf")
+        with open(self.lc, "w") as f:
+            f.write(LOCAL_CONF)
+        self.addCleanup(dsconf.disable_profiling)
+
+    def test_disabled(self):
+        self.assertIsNone(dsconf._profiler)
+        self.assertIsInstance(dsconf._SECTION_RE, re.Pattern)
+        dsconf.IniFile(self._path).set("default", "c", "d")
+
+    def test_counters(self):
+        profiler = dsconf.enable_profiling()
+        dsconf.IniFile(self._path).set("default", "c", "d")
+        [record] = profiler.records
+        self.assertEqual("IniFile.set", record["op"])
+        self.assertEqual(self._path, record["file"])
+        # read once to stream it and once to compare with the new one
+        self.assertEqual(2 * len(BASIC), record["bytes_read"])
+        self.assertEqual(len(BASIC) + len("c = d\n"), record["bytes_written"])
+        self.assertEqual(1, record["rewrites"])
+        self.assertEqual(1, record["temp_files"])
+        self.assertGreater(record["regex_evals"], 0)
+        self.assertGreaterEqual(record["seconds"], 0)
+
+    def test_unchanged(self):
+        profiler = dsconf.enable_profiling()
+        dsconf.IniFile(self._path).remove("default", "missing")
+        [record] = profiler.records
+        self.assertEqual(0, record["rewrites"])
+
+    def test_disable_restores_patterns(self):
+        dsconf.enable_profiling()
+        self.assertNotIsInstance(dsconf._SECTION_RE, re.Pattern)
+        dsconf.disable_profiling()
+        self.assertIsInstance(dsconf._SECTION_RE, re.Pattern)
+        self.assertIsNone(dsconf._profiler)
+
+    def test_nested_operations(self):
+        profiler = dsconf.enable_profiling()
+        target = os.path.join(self._dir, "nova.conf")
+        dsconf.LocalConf(self.lc).extract("post-config", "$NOVA_CONF", target)
+        with dsconf.IniFile(self._path).batch() as doc:
+            doc.set("default", "a", "c")
+        self.assertEqual(["LocalConf.extract", "IniFile.batch"],
+                         [r["op"] for r in profiler.records])
+        self.assertEqual(len("[DEFAULT]\ndebug = True\n"),
+                         profiler.records[0]["bytes_written"])
+
+    def test_worker_threads(self):
+        profiler = dsconf.enable_profiling()
+        dsconf.LocalConf(self.lc).extract_all(
+            "post-config", {"NOVA_CONF": os.path.join(self._dir, "nova")},
+            max_workers=2)
+        [record] = profiler.records
+        self.assertEqual(1, record["rewrites"])
+
+    def test_localrc(self):
+        profiler = dsconf.enable_profiling()
+        dsconf.LocalConf(self.lc).extract_localrc(
+            os.path.join(self._dir, "localrc"))
+        [record] = profiler.records
+        self.assertEqual(len(LOCAL_CONF), record["bytes_read"])
+        self.assertEqual(len("A=1\n"), record["bytes_written"])
+
+    def test_summary(self):
+        profiler = dsconf.enable_profiling()
+        conf = dsconf.IniFile(self._path)
+        conf.set("default", "c", "d")
+        conf.set("default", "e", "f")
+        lines = profiler.summary().splitlines()
+        self.assertEqual("operation", lines[0].split()[0])
+        self.assertEqual(["IniFile.set", "2"], lines[1].split()[:2])
+
+    def test_cli(self):
+        stderr = self.useFixture(fixtures.StringStream("stderr"))
+        self.useFixture(fixtures.MonkeyPatch("sys.stderr", stderr.stream))
+        cmd.main(["dsconf", "--profile", "iniset", self._path, "default",
+                  "a", "c"])
+        stderr.stream.flush()
+        self.assertIn("IniFile.set ", stderr.getDetails()["stderr"].as_text())
+        self.assertIsNone(dsconf._profiler)
+
+    def test_cli_log(self):
+        log = os.path.join(self._dir, "profile.log")
+        for value in ("c", "d"):
+            cmd.main(["dsconf", "--profile-log", log, "iniset", self._path,
+                      "default", "a", value])
+        with open(log) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(["IniFile.set"] * 2, [r["op"] for r in records])
+        for counter in dsconf.PROFILE_COUNTERS + ("seconds", "start", "pid"):
+            self.assertIn(counter, records[0])
+
+    def test_environment(self):
+        reports = []
+        self.useFixture(fixtures.MonkeyPatch(
+            "atexit.register", lambda *args: reports.append(args)))
+        self.useFixture(fixtures.EnvironmentVariable(
+            "DSCONF_PROFILE", "/tmp/log"))
+        dsconf._profile_from_env()
+        self.assertIsNotNone(dsconf._profiler)
+        self.assertEqual([(dsconf._profiler.report, "/tmp/log")], reports)
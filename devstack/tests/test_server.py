@@ -0,0 +1,262 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import io
+import os.path
+import socket
+import threading
+
+import fixtures
+import testtools
+
+from devstack import cmd
+from devstack import server
+
+
+BASIC = """[default]
+a = b
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+a=b
+"""
+
+
+class TestDispatcher(testtools.TestCase):
+
+    def setUp(self):
+        super(TestDispatcher, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+        with open(self._path, "w") as f:
+            f.write(BASIC)
+
+    def _read(self, path=None):
+        with open(path or self._path) as f:
+            return f.read()
+
+    def test_set(self):
+        d = server.Dispatcher()
+        self.assertEqual("ok", d.handle("iniset %s default a 1" % self._path))
+        self.assertEqual("[default]\na = 1\n", self._read())
+
+    def test_unchanged(self):
+        d = server.Dispatcher()
+        self.assertEqual("ok", d.handle("iniset %s default a 1" % self._path))
+        self.assertEqual("ok unchanged",
+                         d.handle("iniset %s default a 1" % self._path))
+        self.assertEqual("ok unchanged",
+                         d.handle("inirm %s default missing" % self._path))
+
+    def test_errors(self):
+        d = server.Dispatcher()
+        missing = os.path.join(self._dir, "missing.ini")
+        self.assertTrue(d.handle("inirm %s a b" % missing).startswith(
+            "error: "))
+        self.assertTrue(d.handle("iniset %s a" % self._path).startswith(
+            "error: "))
+        self.assertTrue(d.handle("serve /tmp/sock").startswith("error: "))
+        self.assertEqual("ok", d.handle(""))
+
+    def test_revalidate(self):
+        d = server.Dispatcher()
+        d.handle("iniset %s default a 1" % self._path)
+        with open(self._path, "w") as f:
+            f.write("[default]\nlonger = content\n")
+        d.handle("iniset %s default e f" % self._path)
+        self.assertEqual("[default]\ne = f\nlonger = content\n",
+                         self._read())
+
+    def test_defer_external_change(self):
+        d = server.Dispatcher(defer=True)
+        d.handle("iniset %s default a 1" % self._path)
+        with open(self._path, "w") as f:
+            f.write("[default]\nlonger = content\n")
+        reply = d.handle("flush")
+        self.assertTrue(reply.startswith("error: "), reply)
+        self.assertIn("changed by another process", reply)
+        self.assertEqual("[default]\nlonger = content\n", self._read())
+        # the external change is picked up for the next edits
+        self.assertEqual("ok", d.handle("iniset %s default e f" % self._path))
+        self.assertEqual("ok", d.handle("flush"))
+        self.assertEqual("[default]\ne = f\nlonger = content\n",
+                         self._read())
+
+    def test_help(self):
+        d = server.Dispatcher()
+        self.assertTrue(d.handle("iniset -h").startswith("error: "))
+        self.assertEqual("ok", d.handle("iniset %s default a 1" % self._path))
+
+    def test_defer(self):
+        d = server.Dispatcher(defer=True)
+        d.handle("iniset %s default a 1" % self._path)
+        d.handle("iniset %s default c 2" % self._path)
+        self.assertEqual(BASIC, self._read())
+        self.assertEqual("ok", d.handle("flush"))
+        self.assertEqual("[default]\nc = 2\na = 1\n", self._read())
+
+    def test_close_flushes(self):
+        d = server.Dispatcher(defer=True)
+        d.handle("iniset %s default a 1" % self._path)
+        d.close()
+        self.assertEqual("[default]\na = 1\n", self._read())
+        self.assertEqual("error: shutting down",
+                         d.handle("iniset %s default a 2" % self._path))
+
+    def test_localconf_flushes_first(self):
+        lc = os.path.join(self._dir, "local.conf")
+        with open(lc, "w") as f:
+            f.write(LOCAL_CONF)
+        d = server.Dispatcher(defer=True)
+        d.handle("iniset %s default a 1" % self._path)
+        self.assertEqual("ok unchanged", d.handle(
+            "extract %s post-config $X %s" % (lc, self._path)))
+        self.assertEqual("[default]\na = 1\n", self._read())
+
+
+class TestServer(testtools.TestCase):
+
+    def test_client(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        sock = os.path.join(tmp, "dsconf.sock")
+        path = os.path.join(tmp, "test.ini")
+        srv = server.Server(sock)
+        thread = threading.Thread(target=srv.serve_forever)
+        thread.start()
+        try:
+            self.assertEqual(0, server.client(
+                sock, ["iniset", path, "default", "a", "b c"]))
+            self.assertEqual(1, server.client(
+                sock, ["inirm", path + ".missing", "default", "a"]))
+            self.assertEqual(0, server.client(sock, ["shutdown"]))
+            thread.join(10)
+        finally:
+            srv.server_close()
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(sock))
+        with open(path) as f:
+            self.assertEqual("[default]\na = b c\n", f.read())
+
+    def test_client_exit_code(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        sock = os.path.join(tmp, "dsconf.sock")
+        path = os.path.join(tmp, "test.ini")
+        srv = server.Server(sock)
+        thread = threading.Thread(target=srv.serve_forever)
+        thread.start()
+        try:
+            iniset = ["iniset", path, "default", "a", "b"]
+            self.assertEqual(0, server.client(sock, iniset, exit_code=True))
+            self.assertEqual(0, server.client(sock, iniset))
+            self.assertEqual(cmd.EXIT_UNCHANGED,
+                             server.client(sock, iniset, exit_code=True))
+            self.assertEqual(0, server.client(sock, ["shutdown"]))
+            thread.join(10)
+        finally:
+            srv.server_close()
+
+    def test_defer_needs_coproc(self):
+        self.useFixture(fixtures.MockPatch('sys.stderr'))
+        self.assertRaises(SystemExit, cmd.main,
+                          ["dsconf", "--defer", "serve", "/tmp/sock"])
+
+    def test_bad_input(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        sock = os.path.join(tmp, "dsconf.sock")
+        srv = server.Server(sock)
+        thread = threading.Thread(target=srv.serve_forever)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(sock)
+                s.sendall(b"\xff\xfe\niniset --help\nshutdown\n")
+                s.shutdown(socket.SHUT_WR)
+                with s.makefile('r') as reader:
+                    replies = reader.read().splitlines()
+            thread.join(10)
+        finally:
+            srv.server_close()
+        self.assertEqual(3, len(replies))
+        self.assertTrue(replies[0].startswith("error: "))
+        self.assertTrue(replies[1].startswith("error: "))
+        self.assertEqual("ok", replies[2])
+
+    def test_socket_in_use(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        sock = os.path.join(tmp, "dsconf.sock")
+        srv = server.Server(sock)
+        try:
+            self.assertRaises(OSError, server.Server, sock)
+            self.assertTrue(os.path.exists(sock))
+        finally:
+            srv.server_close()
+        self.assertFalse(os.path.exists(sock))
+
+    def test_stale_socket(self):
+        tmp = self.useFixture(fixtures.TempDir()).path
+        sock = os.path.join(tmp, "dsconf.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(sock)
+        stale.close()
+        srv = server.Server(sock)
+        srv.server_close()
+        self.assertFalse(os.path.exists(sock))
+
+
+class TestCoproc(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCoproc, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self._path = os.path.join(self._dir, "test.ini")
+
+    def _run(self, lines, defer=False):
+        writer = io.StringIO()
+        server.serve_stream(io.StringIO("".join(lines)), writer, defer)
+        return writer.getvalue().splitlines()
+
+    def test_replies(self):
+        replies = self._run([
+            "iniset %s default a b\n" % self._path,
+            "inirm %s default a\n" % (self._path + ".missing"),
+            "iniset %s default c d\n" % self._path,
+            "exit\n",
+            "iniset %s default e f\n" % self._path,
+        ])
+        self.assertEqual("ok", replies[0])
+        self.assertTrue(replies[1].startswith("error: "))
+        self.assertEqual(["ok", "ok"], replies[2:])
+        with open(self._path) as f:
+            self.assertEqual("[default]\nc = d\na = b\n", f.read())
+
+    def test_help_does_not_end_coproc(self):
+        stdout = self.useFixture(fixtures.MockPatch('sys.stdout')).mock
+        replies = self._run([
+            "iniset %s default a 1\n" % self._path,
+            "iniset -h\n",
+            "iniset %s default a 2\n" % self._path,
+        ])
+        self.assertEqual("ok", replies[0])
+        self.assertTrue(replies[1].startswith("error: "))
+        self.assertEqual("ok", replies[2])
+        self.assertFalse(stdout.write.called)
+        with open(self._path) as f:
+            self.assertEqual("[default]\na = 2\n", f.read())
+
+    def test_defer_written_at_eof(self):
+        replies = self._run([
+            "iniset %s default a b\n" % self._path,
+            "iniset %s default c d\n" % self._path,
+        ], defer=True)
+        self.assertEqual(["ok", "ok"], replies)
+        with open(self._path) as f:
+            self.assertEqual("[default]\nc = d\na = b\n", f.read())
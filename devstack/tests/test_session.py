@@ -0,0 +1,159 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import os.path
+
+import fixtures
+import testtools
+
+from devstack import dsconf
+
+
+BASIC = """[DEFAULT]
+debug = False
+"""
+
+LOCAL_CONF = """[[local|localrc]]
+A=1
+"""
+
+
+class TestSession(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSession, self).setUp()
+        self._dir = self.useFixture(fixtures.TempDir()).path
+        self.nova = self._write("nova.conf", BASIC)
+        self.glance = self._write("glance.conf", BASIC)
+        self.lc = self._write("local.conf", LOCAL_CONF)
+        self.loads = []
+        load = dsconf.IniDocument.load.__func__
+
+        def _load(cls, fname):
+            self.loads.append(fname)
+            return load(cls, fname)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            "devstack.dsconf.IniDocument.load", classmethod(_load)))
+
+    def _write(self, name, content):
+        path = os.path.join(self._dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_cached_by_path(self):
+        session = dsconf.Session()
+        nova = session.ini(self.nova)
+        self.assertIs(nova, session.ini(
+            os.path.join(self._dir, ".", "nova.conf")))
+        self.assertEqual("False", nova.get("DEFAULT", "debug"))
+        self.assertTrue(nova.set("DEFAULT", "debug", "True"))
+        self.assertEqual("True", nova.get("DEFAULT", "debug"))
+        self.assertTrue(nova.has("DEFAULT", "debug"))
+        self.assertEqual([self.nova], self.loads)
+
+    def test_held_until_flush(self):
+        session = dsconf.Session()
+        session.ini(self.nova).set("DEFAULT", "debug", "True")
+        session.ini(self.glance).set("DEFAULT", "debug", "False")
+        self.assertEqual(BASIC, self._read(self.nova))
+        self.assertEqual({self.nova: True}, session.flush())
+        self.assertEqual("[DEFAULT]\ndebug = True\n", self._read(self.nova))
+        # written files are not parsed again
+        self.assertEqual("True", session.ini(self.nova).get(
+            "DEFAULT", "debug"))
+        self.assertEqual({}, session.flush())
+        self.assertEqual([self.nova, self.glance], self.loads)
+
+    def test_parallel_flush(self):
+        paths = [self._write("%d.conf" % i, BASIC) for i in range(8)]
+        session = dsconf.Session()
+        for path in paths:
+            session.ini(path).set("DEFAULT", "debug", "True")
+        results = session.flush(max_workers=4)
+        self.assertEqual(dict.fromkeys(paths, True), results)
+        for path in paths:
+            self.assertIn("debug = True", self._read(path))
+
+    def test_flush_error(self):
+        missing = os.path.join(self._dir, "missing", "x.conf")
+        session = dsconf.Session()
+        session.ini(missing).add("DEFAULT", "debug", "True")
+        session.ini(self.nova).set("DEFAULT", "debug", "True")
+        self.assertRaises(OSError, session.flush)
+        self.assertIn("debug = True", self._read(self.nova))
+
+    def test_context(self):
+        with dsconf.Session() as session:
+            session.ini(self.nova).set("DEFAULT", "debug", "True")
+            session.local_conf(self.lc).set_local("B=2")
+        self.assertIn("debug = True", self._read(self.nova))
+        self.assertEqual(LOCAL_CONF + "B=2\n", self._read(self.lc))
+
+    def test_context_error(self):
+        try:
+            with dsconf.Session() as session:
+                session.ini(self.nova).set("DEFAULT", "debug", "True")
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        self.assertEqual(BASIC, self._read(self.nova))
+
+    def test_edit(self):
+        session = dsconf.Session()
+        nova = session.ini(self.nova)
+        with nova.edit() as doc:
+            doc.set("DEFAULT", "debug", "True")
+            doc.set("DEFAULT", "verbose", "True")
+        self.assertTrue(nova.dirty)
+        self.assertEqual({self.nova: True}, session.flush())
+
+    def test_revalidate(self):
+        session = dsconf.Session()
+        nova = session.ini(self.nova)
+        self.assertEqual("False", nova.get("DEFAULT", "debug"))
+        self._write("nova.conf", "[DEFAULT]\ndebug = Yes\n")
+        self.assertEqual("Yes", nova.get("DEFAULT", "debug"))
+        self.assertEqual([self.nova, self.nova], self.loads)
+
+    def test_changed_under_held_edits(self):
+        session = dsconf.Session()
+        nova = session.ini(self.nova)
+        nova.set("DEFAULT", "debug", "True")
+        self._write("nova.conf", "[DEFAULT]\ndebug = Yes\nmore = 1\n")
+        self.assertRaises(dsconf.FileChangedError, session.flush)
+        self.assertEqual("Yes", nova.get("DEFAULT", "debug"))
+        self.assertEqual({}, session.flush())
+
+    def test_external(self):
+        session = dsconf.Session()
+        nova = session.ini(self.nova)
+        nova.set("DEFAULT", "debug", "True")
+        with session.external(self.nova, self.glance):
+            self.assertIn("debug = True", self._read(self.nova))
+            dsconf.IniFile(self.nova).set("DEFAULT", "debug", "Maybe")
+        self.assertEqual("Maybe", nova.get("DEFAULT", "debug"))
+
+    def test_kinds(self):
+        session = dsconf.Session()
+        session.ini(self.nova)
+        self.assertRaises(ValueError, session.local_conf, self.nova)
+        lc = session.local_conf(self.lc)
+        self.assertEqual([("local", "localrc")], lc.groups())
+        self.assertRaises(AttributeError, getattr, lc, "get")
+        self.assertRaises(AttributeError, getattr, lc, "_feed")